@@ -0,0 +1,110 @@
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+QUERY_METHODS = ('fetch', 'fetchrow', 'fetchval', 'execute', 'executemany', 'copy_records_to_table')
+
+
+class _Counting:
+    def __init__(self, target, pool: "CountingPool"):
+        self._target = target
+        self._pool = pool
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if name == 'prepared':
+            async def counted_prepared(*args, **kwargs):
+                return _Counting(await attr(*args, **kwargs), self._pool)
+            return counted_prepared
+        if name not in QUERY_METHODS:
+            return attr
+
+        async def counted(*args, **kwargs):
+            self._pool.queries += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+
+class _CountingAcquire:
+    def __init__(self, pool: "CountingPool"):
+        self._pool = pool
+        self._ctx = pool._pool.acquire()
+
+    async def __aenter__(self) -> _Counting:
+        self._pool.acquires += 1
+        return _Counting(await self._ctx.__aenter__(), self._pool)
+
+    async def __aexit__(self, *exc) -> None:
+        await self._ctx.__aexit__(*exc)
+
+
+class CountingPool:
+    def __init__(self, pool):
+        self._pool = pool
+        self.queries = 0
+        self.acquires = 0
+
+    def acquire(self) -> _CountingAcquire:
+        return _CountingAcquire(self)
+
+    def reset(self) -> None:
+        self.queries = 0
+        self.acquires = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+
+async def create_user(pool, role: str) -> Dict:
+    telegram_id = -random.randint(10 ** 9, 10 ** 12)
+    async with pool.acquire() as conn:
+        user_id = await conn.fetchval(
+            "INSERT INTO users (telegram_id, username, full_name, role) VALUES ($1, $2, $3, $4) RETURNING id",
+            telegram_id, f"bench_{role}_{-telegram_id}", f"Benchmark {role}", role
+        )
+    return {'id': user_id, 'telegram_id': telegram_id, 'role': role}
+
+
+async def create_recipes(pool, doctor_id: int, count: int, items_per_recipe: int = 3) -> List[int]:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            recipe_ids = [row['id'] for row in await conn.fetch(
+                "INSERT INTO recipes (doctor_id, duration_days, comment, status) "
+                "SELECT $1, 30, 'benchmark', 'active' FROM generate_series(1, $2) RETURNING id",
+                doctor_id, count
+            )]
+            await conn.executemany(
+                "INSERT INTO recipe_items (recipe_id, drug_name, quantity) VALUES ($1, $2, $3)",
+                [(recipe_id, f"Препарат {n}", n + 1) for recipe_id in recipe_ids for n in range(items_per_recipe)]
+            )
+    return recipe_ids
+
+
+async def delete_users(pool, user_ids: List[int]) -> None:
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM users WHERE id = ANY($1::int[])", user_ids)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure(call: Callable[[], Awaitable[Any]], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95)
+    }
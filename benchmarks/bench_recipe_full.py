@@ -0,0 +1,54 @@
+"""Просмотр списанного рецепта: get_recipe_full (один запрос) против get_recipe_by_id + get_recipe_logs.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/bench_recipe_full.py
+"""
+import asyncio
+from _common import CountingPool, create_user, create_recipes, delete_users, measure
+
+from db.database import db
+from services.recipe_service import get_recipe_by_id, get_recipe_logs, get_recipe_full, invalidate_recipe_cache
+
+ITEMS = 5
+LOGS = 5
+REPEAT = 200
+
+
+# Кэш рецептов сбрасывается перед каждым вызовом, чтобы мерить именно запросы к базе
+async def fetch_separately(recipe_id: int, pool):
+    invalidate_recipe_cache(recipe_id)
+    recipe = await get_recipe_by_id(recipe_id, pool)
+    logs = await get_recipe_logs(recipe_id, pool)
+    return {**recipe, 'logs': logs}
+
+
+async def fetch_full(recipe_id: int, pool):
+    invalidate_recipe_cache(recipe_id)
+    return await get_recipe_full(recipe_id, pool)
+
+
+async def main():
+    pool = CountingPool(await db.connect())
+    doctor = await create_user(pool, 'doctor')
+    pharmacist = await create_user(pool, 'pharmacist')
+    try:
+        [recipe_id] = await create_recipes(pool, doctor['id'], 1, items_per_recipe=ITEMS)
+        async with pool.acquire() as conn:
+            await conn.executemany(
+                "INSERT INTO recipe_logs (recipe_id, pharmacist_id, action_type, changes) VALUES ($1, $2, 'edited_quantity', '{}'::jsonb)",
+                [(recipe_id, pharmacist['id'])] * LOGS
+            )
+
+        print(f"{'variant':>10} | {'queries':>7} | {'acquires':>8} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8}")
+        for name, fn in (('separate', fetch_separately), ('full', fetch_full)):
+            pool.reset()
+            await fn(recipe_id, pool)
+            queries, acquires = pool.queries, pool.acquires
+            stats = await measure(lambda: fn(recipe_id, pool), REPEAT)
+            print(f"{name:>10} | {queries:>7} | {acquires:>8} | {stats['mean_ms']:>8.2f} | {stats['p50_ms']:>8.2f} | {stats['p95_ms']:>8.2f}")
+    finally:
+        await delete_users(pool, [doctor['id'], pharmacist['id']])
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
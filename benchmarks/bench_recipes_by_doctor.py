@@ -0,0 +1,49 @@
+"""Сравнение get_recipes_page_by_doctor (один запрос на страницу) с прежним циклом N+1.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/bench_recipes_by_doctor.py
+"""
+import asyncio
+from _common import CountingPool, create_user, create_recipes, delete_users, measure
+
+from db.database import db
+from services.recipe_service import get_recipes_page_by_doctor
+
+SIZES = (10, 50, 500)
+REPEAT = 30
+
+
+async def get_recipes_page_by_doctor_loop(doctor_id: int, pool, limit: int):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT r.id, r.created_at, r.duration_days, r.expires_at, r.comment, r.status FROM recipes r WHERE r.doctor_id = $1 ORDER BY r.created_at DESC, r.id DESC LIMIT $2",
+            doctor_id, limit
+        )
+        recipes = []
+        for row in rows:
+            items_count = await conn.fetchval("SELECT count(*) FROM recipe_items WHERE recipe_id = $1", row['id'])
+            recipes.append({**dict(row), 'items_count': items_count})
+        return recipes
+
+
+async def main():
+    pool = CountingPool(await db.connect())
+    doctor = await create_user(pool, 'doctor')
+    try:
+        created = 0
+        print(f"{'recipes':>8} | {'variant':>10} | {'queries':>7} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8}")
+        for size in SIZES:
+            await create_recipes(pool, doctor['id'], size - created)
+            created = size
+            for name, fn in (('loop', get_recipes_page_by_doctor_loop), ('keyset', get_recipes_page_by_doctor)):
+                pool.reset()
+                await fn(doctor['id'], pool, limit=size)
+                queries = pool.queries
+                stats = await measure(lambda: fn(doctor['id'], pool, limit=size), REPEAT)
+                print(f"{size:>8} | {name:>10} | {queries:>7} | {stats['mean_ms']:>8.2f} | {stats['p50_ms']:>8.2f} | {stats['p95_ms']:>8.2f}")
+    finally:
+        await delete_users(pool, [doctor['id']])
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
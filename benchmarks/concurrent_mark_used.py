@@ -0,0 +1,40 @@
+"""Гонка списания: много фармацевтов одновременно списывают один рецепт, выиграть должен ровно один.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/concurrent_mark_used.py
+"""
+import asyncio
+from _common import create_user, create_recipes, delete_users
+
+from db.database import db
+from services.recipe_service import mark_recipe_as_used
+
+PHARMACISTS = 5
+ATTEMPTS = 50
+ROUNDS = 20
+
+
+async def main():
+    pool = await db.connect()
+    doctor = await create_user(pool, 'doctor')
+    pharmacists = [await create_user(pool, 'pharmacist') for _ in range(PHARMACISTS)]
+    try:
+        recipe_ids = await create_recipes(pool, doctor['id'], ROUNDS, items_per_recipe=1)
+        for recipe_id in recipe_ids:
+            results = await asyncio.gather(*(
+                mark_recipe_as_used(recipe_id, pharmacists[n % PHARMACISTS]['id'], pool) for n in range(ATTEMPTS)
+            ))
+            async with pool.acquire() as conn:
+                logs = await conn.fetchval("SELECT count(*) FROM recipe_logs WHERE recipe_id = $1 AND action_type = 'used'", recipe_id)
+                status = await conn.fetchval("SELECT status FROM recipes WHERE id = $1", recipe_id)
+            winners = sum(results)
+            assert winners == 1, f"рецепт #{recipe_id}: выиграли {winners} из {ATTEMPTS}"
+            assert logs == 1, f"рецепт #{recipe_id}: записей о списании {logs}"
+            assert status == 'used', f"рецепт #{recipe_id}: статус {status}"
+        print(f"OK: {ROUNDS} рецептов x {ATTEMPTS} параллельных списаний, в каждом раунде ровно один победитель")
+    finally:
+        await delete_users(pool, [doctor['id']] + [p['id'] for p in pharmacists])
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""Нагрузочный тест: синтетические апдейты через тот же Dispatcher, что и в main.py.
+
+Bot API подменён фейковой сессией, база — настоящая из DATABASE_URL. Для каждого сценария
+печатаются пропускная способность, p50/p95/p99 обработки апдейта и число запросов к базе на апдейт.
+Троттлинг и дебаунс отключены: синтетические пользователи шлют апдейты быстрее живых.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/load_test.py
+"""
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+os.environ.setdefault("THROTTLE_RATE", "0")
+os.environ.setdefault("DEBOUNCE_PREFIXES", "")
+
+from _common import CountingPool, create_user, create_recipes, delete_users, percentile
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod, SendMessage, EditMessageText, EditMessageReplyMarkup
+from aiogram.types import Update, Message, CallbackQuery, Chat, User
+from config import BOT_TOKEN
+from db.database import db
+from db.fsm_storage import create_fsm_storage
+from main import build_dispatcher
+from services.drug_service import warm_up_drug_index
+from services.recipe_service import warm_up_external_ids
+
+DOCTORS = 20
+PHARMACISTS = 20
+ROUNDS = 10
+RECIPES_PER_DOCTOR = 12
+# Точное совпадение со справочником: иначе сценарий создания остановится на выборе подсказки
+DRUG_NAME = "Парацетамол"
+
+
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.requests += 1
+        if isinstance(method, (SendMessage, EditMessageText, EditMessageReplyMarkup)):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=getattr(method, 'text', None)
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class LoadClient:
+    def __init__(self, dp, bot: Bot):
+        self.dp = dp
+        self.bot = bot
+        self.samples: List[float] = []
+        self._update_ids = itertools.count(1)
+
+    def _message(self, telegram_id: int, text: str) -> Message:
+        return Message(
+            message_id=next(self._update_ids),
+            date=datetime.now(),
+            chat=Chat(id=telegram_id, type="private"),
+            from_user=User(id=telegram_id, is_bot=False, first_name="Load"),
+            text=text
+        )
+
+    async def _feed(self, update: Update) -> None:
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.samples.append((time.perf_counter() - started) * 1000)
+
+    async def send(self, telegram_id: int, text: str) -> None:
+        await self._feed(Update(update_id=next(self._update_ids), message=self._message(telegram_id, text)))
+
+    async def click(self, telegram_id: int, data: str) -> None:
+        callback = CallbackQuery(
+            id=str(next(self._update_ids)),
+            from_user=User(id=telegram_id, is_bot=False, first_name="Load"),
+            chat_instance="load",
+            message=self._message(telegram_id, "..."),
+            data=data
+        )
+        await self._feed(Update(update_id=next(self._update_ids), callback_query=callback))
+
+
+async def create_recipe_flow(client: LoadClient, doctor: Dict) -> None:
+    telegram_id = doctor['telegram_id']
+    await client.send(telegram_id, "➕ Добавить рецепт")
+    await client.send(telegram_id, f"load-{uuid.uuid4().hex}")
+    await client.send(telegram_id, DRUG_NAME)
+    await client.send(telegram_id, "2")
+    await client.click(telegram_id, "continue_recipe")
+    await client.send(telegram_id, "/skip")
+    await client.click(telegram_id, "duration_30")
+    await client.click(telegram_id, "confirm_recipe")
+
+
+async def lookup_flow(client: LoadClient, pharmacist: Dict, recipe_id: int) -> None:
+    await client.send(pharmacist['telegram_id'], "🔍 Проверить рецепт")
+    await client.send(pharmacist['telegram_id'], str(recipe_id))
+
+
+async def mark_used_flow(client: LoadClient, pharmacist: Dict, recipe_id: int) -> None:
+    await client.click(pharmacist['telegram_id'], f"mark_used_{recipe_id}")
+
+
+async def my_recipes_flow(client: LoadClient, doctor: Dict, recipe_id: int) -> None:
+    await client.send(doctor['telegram_id'], "📋 Мои рецепты")
+    await client.click(doctor['telegram_id'], "recipes_page_next")
+    await client.send(doctor['telegram_id'], "📋 Мои рецепты")
+    await client.send(doctor['telegram_id'], str(recipe_id))
+
+
+async def run_scenario(
+    name: str,
+    client: LoadClient,
+    pool: CountingPool,
+    session: FakeSession,
+    users: List[Dict],
+    flow: Callable[[Dict, int], Awaitable[None]]
+) -> None:
+    # Пользователи работают параллельно, каждый проходит свои раунды последовательно (FSM на пользователя)
+    async def user_loop(index: int, user: Dict) -> None:
+        for round_no in range(ROUNDS):
+            await flow(user, index * ROUNDS + round_no)
+
+    client.samples = []
+    pool.reset()
+    session.requests = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(index, user) for index, user in enumerate(users)))
+    elapsed = time.perf_counter() - started
+
+    updates = len(client.samples)
+    print(
+        f"{name:>12} | {updates:>7} | {updates / elapsed:>8.1f} | {percentile(client.samples, 50):>7.2f} | "
+        f"{percentile(client.samples, 95):>7.2f} | {percentile(client.samples, 99):>7.2f} | "
+        f"{pool.queries / updates:>9.2f} | {session.requests / updates:>8.2f}"
+    )
+
+
+async def seed_drug(pool, name: str) -> bool:
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "INSERT INTO drugs (name) VALUES ($1) ON CONFLICT ((lower(name))) DO NOTHING RETURNING true", name
+        ) is not None
+
+
+async def main():
+    pool = CountingPool(await db.connect())
+    drug_seeded = await seed_drug(pool, DRUG_NAME)
+    # Те же прогревы, что и в main.main: без них проверки дубликатов и подсказки уходят в базу
+    await warm_up_external_ids(pool)
+    await warm_up_drug_index(pool)
+    storage = create_fsm_storage(pool)
+    session = FakeSession()
+    bot = Bot(token=BOT_TOKEN, session=session)
+    client = LoadClient(build_dispatcher(pool, storage), bot)
+
+    doctors = [await create_user(pool, 'doctor') for _ in range(DOCTORS)]
+    pharmacists = [await create_user(pool, 'pharmacist') for _ in range(PHARMACISTS)]
+    try:
+        doctor_recipes = [await create_recipes(pool, doctor['id'], RECIPES_PER_DOCTOR) for doctor in doctors]
+        all_recipes = [recipe_id for recipes in doctor_recipes for recipe_id in recipes]
+        doctor_by_id = {doctor['telegram_id']: recipes for doctor, recipes in zip(doctors, doctor_recipes)}
+
+        print(f"{'scenario':>12} | {'updates':>7} | {'upd/s':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'queries/u':>9} | {'api/u':>8}")
+        await run_scenario("create", client, pool, session, doctors,
+                           lambda doctor, n: create_recipe_flow(client, doctor))
+        await run_scenario("lookup", client, pool, session, pharmacists,
+                           lambda pharmacist, n: lookup_flow(client, pharmacist, all_recipes[n % len(all_recipes)]))
+        await run_scenario("my_recipes", client, pool, session, doctors,
+                           lambda doctor, n: my_recipes_flow(client, doctor, doctor_by_id[doctor['telegram_id']][n % RECIPES_PER_DOCTOR]))
+        # Каждый раунд списывает свой рецепт, чтобы мерить успешное списание, а не отказ
+        await run_scenario("mark_used", client, pool, session, pharmacists,
+                           lambda pharmacist, n: mark_used_flow(client, pharmacist, all_recipes[n % len(all_recipes)]))
+    finally:
+        await storage.close()
+        if drug_seeded:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM drugs WHERE name = $1", DRUG_NAME)
+        await delete_users(pool, [user['id'] for user in doctors + pharmacists])
+        await db.disconnect()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,3 +11,79 @@ if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL не найден в переменных окружения")
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+UNKNOWN_USER_CACHE_TTL = float(os.getenv("UNKNOWN_USER_CACHE_TTL", "30"))
+UNKNOWN_USER_CACHE_SIZE = int(os.getenv("UNKNOWN_USER_CACHE_SIZE", "50000"))
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "300"))
+UNREGISTERED_REPLY_INTERVAL = float(os.getenv("UNREGISTERED_REPLY_INTERVAL", "60"))
+UNREGISTERED_REPLY_CACHE_SIZE = int(os.getenv("UNREGISTERED_REPLY_CACHE_SIZE", "50000"))
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "5000"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+FSM_MAX_DIRTY = int(os.getenv("FSM_MAX_DIRTY", "500"))
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "600"))
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+
+RECIPE_CACHE_TTL = float(os.getenv("RECIPE_CACHE_TTL", "30"))
+RECIPE_CACHE_SIZE = int(os.getenv("RECIPE_CACHE_SIZE", "2000"))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("BOT_MODE должен быть 'polling' или 'webhook'")
+if BOT_MODE == "webhook" and (not WEBHOOK_BASE_URL or not WEBHOOK_SECRET):
+    raise ValueError("Для BOT_MODE=webhook нужны WEBHOOK_BASE_URL и WEBHOOK_SECRET")
+
+READY_CACHE_TTL = float(os.getenv("READY_CACHE_TTL", "5"))
+READY_DB_TIMEOUT = float(os.getenv("READY_DB_TIMEOUT", "2"))
+READY_MAX_POLL_AGE = float(os.getenv("READY_MAX_POLL_AGE", "120"))
+READY_MAX_UPDATE_AGE = float(os.getenv("READY_MAX_UPDATE_AGE", "0"))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Доля логируемых обновлений по типам, например "callback_query:0.2,message:1"
+LOG_SAMPLE_RATES = {
+    update_type.strip(): float(rate)
+    for update_type, rate in (pair.split(":") for pair in os.getenv("LOG_SAMPLE_RATES", "callback_query:0.2").split(",") if pair.strip())
+}
+LOG_SLOW_UPDATE_MS = float(os.getenv("LOG_SLOW_UPDATE_MS", "500"))
+
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+DEBOUNCE_WINDOW = float(os.getenv("DEBOUNCE_WINDOW", "3"))
+DEBOUNCE_PREFIXES = tuple(p.strip() for p in os.getenv("DEBOUNCE_PREFIXES", "mark_used_,confirm_recipe,batch_confirm").split(",") if p.strip())
+
+# Лимиты Bot API: около 30 сообщений в секунду на бота и не чаще 1 в секунду в один чат
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+OUTBOUND_MAX_CHATS = int(os.getenv("OUTBOUND_MAX_CHATS", "10000"))
+
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "300"))
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+
+BATCH_DISPENSE_MAX_SIZE = int(os.getenv("BATCH_DISPENSE_MAX_SIZE", "100"))
+
+# Фильтр Блума по external_id: размер при прогреве — max(минимум, 2 x число рецептов)
+EXTERNAL_ID_FILTER_MIN_CAPACITY = int(os.getenv("EXTERNAL_ID_FILTER_MIN_CAPACITY", "100000"))
+EXTERNAL_ID_FILTER_ERROR_RATE = float(os.getenv("EXTERNAL_ID_FILTER_ERROR_RATE", "0.01"))
+
+DRUG_SUGGESTIONS_LIMIT = int(os.getenv("DRUG_SUGGESTIONS_LIMIT", "5"))
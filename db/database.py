@@ -1,29 +1,235 @@
+import asyncio
+import json
+import logging
+import time
 import asyncpg
-from typing import Optional
-from config import DATABASE_URL
+from asyncpg.prepared_stmt import PreparedStatement
+from typing import Optional, Dict, Any, List, Callable
+from db.migrations import run_migrations
+from utils.metrics import record_pool_acquire
+from config import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_INACTIVE_LIFETIME,
+    DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+# Payload NOTIFY ограничен 8000 байт: до 500 id по 10 цифр с разделителями укладываются с запасом
+NOTIFY_IDS_CHUNK = 500
+# Статус для карточки рецепта: активный рецепт с истёкшим сроком показывается просроченным, не дожидаясь фоновой задачи
+EFFECTIVE_STATUS_SQL = "CASE WHEN r.status = 'active' AND r.expires_at <= LOCALTIMESTAMP THEN 'expired' ELSE r.status END AS status"
+LISTENER_RECONNECT_DELAY = 5
+
+# Горячие запросы, которые готовятся на каждом соединении пула при его создании
+PREPARED_STATEMENTS: Dict[str, str] = {
+    'user_by_telegram_id': "SELECT id, telegram_id, username, full_name, role FROM users WHERE telegram_id = $1",
+    'recipe_by_id': f"SELECT r.id, r.doctor_id, r.created_at, r.duration_days, r.expires_at, r.comment, {EFFECTIVE_STATUS_SQL}, r.external_id, u.username as doctor_username, u.full_name as doctor_name FROM recipes r JOIN users u ON r.doctor_id = u.id WHERE r.id = $1",
+    'recipe_id_by_external_id': "SELECT id FROM recipes WHERE external_id = $1",
+    'items_by_recipe': "SELECT id, drug_name, quantity FROM recipe_items WHERE recipe_id = $1",
+    'logs_by_recipe': "SELECT rl.id, rl.action_type, rl.changes, rl.created_at, u.username as pharmacist_username, u.full_name as pharmacist_name FROM recipe_logs rl JOIN users u ON rl.pharmacist_id = u.id WHERE rl.recipe_id = $1 ORDER BY rl.created_at DESC",
+    'recipe_full': f"""
+        SELECT r.id, r.doctor_id, r.created_at, r.duration_days, r.expires_at, r.comment, {EFFECTIVE_STATUS_SQL}, r.external_id,
+               u.username as doctor_username, u.full_name as doctor_name,
+               COALESCE((
+                   SELECT json_agg(json_build_object('id', ri.id, 'drug_name', ri.drug_name, 'quantity', ri.quantity) ORDER BY ri.id)
+                   FROM recipe_items ri WHERE ri.recipe_id = r.id
+               ), '[]'::json) AS items,
+               COALESCE((
+                   SELECT json_agg(json_build_object(
+                       'id', rl.id, 'action_type', rl.action_type, 'changes', rl.changes, 'created_at', rl.created_at,
+                       'pharmacist_username', pu.username, 'pharmacist_name', pu.full_name
+                   ) ORDER BY rl.created_at DESC)
+                   FROM recipe_logs rl JOIN users pu ON rl.pharmacist_id = pu.id WHERE rl.recipe_id = r.id
+               ), '[]'::json) AS logs
+        FROM recipes r JOIN users u ON r.doctor_id = u.id
+        WHERE r.id = $1
+    """,
+}
+
+
+class PreparedConnection(asyncpg.Connection):
+    __slots__ = ('_prepared',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared: Dict[str, PreparedStatement] = {}
+
+    async def prepare_registered(self) -> None:
+        for name, sql in PREPARED_STATEMENTS.items():
+            self._prepared[name] = await self.prepare(sql)
+
+    async def prepared(self, name: str) -> PreparedStatement:
+        statement = self._prepared.get(name)
+        if statement is None:
+            statement = self._prepared[name] = await self.prepare(PREPARED_STATEMENTS[name])
+        return statement
+
+
+class _TimedAcquire:
+    def __init__(self, pool: "InstrumentedPool", timeout: Optional[float]):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def _acquire(self):
+        started = time.perf_counter()
+        conn = await self._pool.pool.acquire(timeout=self._timeout)
+        self._pool.record_acquire(time.perf_counter() - started)
+        return conn
+
+    async def __aenter__(self):
+        self._conn = await self._acquire()
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+
+# Обёртка над asyncpg.Pool, считающая время ожидания соединения и число выданных соединений
+class InstrumentedPool:
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.acquisitions = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _TimedAcquire:
+        return _TimedAcquire(self, timeout)
+
+    async def release(self, conn, *, timeout: Optional[float] = None) -> None:
+        self.in_use -= 1
+        await self.pool.release(conn, timeout=timeout)
+
+    def record_acquire(self, wait: float) -> None:
+        self.acquisitions += 1
+        self.in_use += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        record_pool_acquire(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size': self.pool.get_size(),
+            'idle': self.pool.get_idle_size(),
+            'acquired': self.in_use,
+            'min_size': self.pool.get_min_size(),
+            'max_size': self.pool.get_max_size(),
+            'acquisitions': self.acquisitions,
+            'wait_avg_ms': round(self.wait_total / self.acquisitions * 1000, 3) if self.acquisitions else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3)
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+
+async def _init_connection(conn: PreparedConnection) -> None:
+    await conn.prepare_registered()
+
+
+async def notify_change(conn: asyncpg.Connection, table: str, **payload: Any) -> None:
+    # Внутри транзакции уведомление уходит только после COMMIT
+    await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, json.dumps({'table': table, **payload}, default=str))
+
+
+async def notify_ids_change(conn: asyncpg.Connection, table: str, field: str, ids: List[int]) -> None:
+    # Длинный список id уходит несколькими уведомлениями, иначе pg_notify откатит всю транзакцию
+    for start in range(0, len(ids), NOTIFY_IDS_CHUNK):
+        await notify_change(conn, table, **{field: ids[start:start + NOTIFY_IDS_CHUNK]})
 
 
 class Database:
     def __init__(self):
-        self.pool: Optional[asyncpg.Pool] = None
+        self.pool: Optional[InstrumentedPool] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._closing = False
+        # payload=None означает «сбросить всё»: после переподключения часть уведомлений могла потеряться
+        self._invalidation_handlers: Dict[str, List[Callable[[Optional[Dict]], None]]] = {}
+
+    def subscribe(self, table: str, handler: Callable[[Optional[Dict]], None]) -> None:
+        self._invalidation_handlers.setdefault(table, []).append(handler)
 
-    async def connect(self) -> asyncpg.Pool:
-        self.pool = await asyncpg.create_pool(DATABASE_URL)
-        await self._run_migrations()
+    async def connect(self) -> InstrumentedPool:
+        # Миграции до создания пула: init-хук готовит запросы к уже существующим таблицам
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            await run_migrations(conn)
+        finally:
+            await conn.close()
+
+        pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            connection_class=PreparedConnection,
+            init=_init_connection
+        )
+        self.pool = InstrumentedPool(pool)
+        self._closing = False
+        await self._start_listener()
         return self.pool
 
     async def disconnect(self):
+        self._closing = True
+        if self._listener_task:
+            self._listener_task.cancel()
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
         if self.pool:
             await self.pool.close()
 
-    async def _run_migrations(self):
-        import os
-        async with self.pool.acquire() as conn:
-            migration_path = os.path.join('migrations', '001_initial_schema.sql')
-            if os.path.exists(migration_path):
-                with open(migration_path, 'r', encoding='utf-8') as f:
-                    migration_sql = f.read()
-                await conn.execute(migration_sql)
+    async def _start_listener(self) -> None:
+        self._listener = await asyncpg.connect(DATABASE_URL)
+        await self._listener.add_listener(INVALIDATION_CHANNEL, self._on_notification)
+        self._listener.add_termination_listener(self._on_listener_terminated)
+
+    def _on_notification(self, conn, pid: int, channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Некорректное уведомление {channel}: {payload}")
+            return
+        self._dispatch(event.get('table'), event)
+
+    def _dispatch(self, table: Optional[str], event: Optional[Dict]) -> None:
+        tables = [table] if table else list(self._invalidation_handlers)
+        for name in tables:
+            for handler in self._invalidation_handlers.get(name, []):
+                try:
+                    handler(event)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика инвалидации {name}: {e}", exc_info=True)
+
+    def _on_listener_terminated(self, conn) -> None:
+        if self._closing:
+            return
+        logger.warning("Соединение LISTEN потеряно, переподключаемся...")
+        self._listener_task = asyncio.get_running_loop().create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self) -> None:
+        while not self._closing:
+            try:
+                await self._start_listener()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.error(f"Не удалось переподключить LISTEN: {e}")
+                await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+                continue
+            self._dispatch(None, None)
+            logger.info("Соединение LISTEN восстановлено, кэши сброшены")
+            return
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        return self.pool.stats() if self.pool else {}
 
 
 db = Database()
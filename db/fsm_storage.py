@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+import asyncpg
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import FSM_STORAGE, FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_MAX_DIRTY, FSM_STATE_TTL, FSM_CLEANUP_INTERVAL
+from db.database import db, notify_change
+from utils.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+RowKey = Tuple[int, int, int, int, str, str]
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+# Ключ в JSON занимает до ~100 байт, пачка укладывается в лимит payload NOTIFY (8000 байт)
+NOTIFY_KEYS_CHUNK = 50
+
+UPSERT_SQL = """
+    INSERT INTO fsm_storage (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny, state, data, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb, NOW())
+    ON CONFLICT (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+    DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+"""
+DELETE_SQL = """
+    DELETE FROM fsm_storage
+    WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3 AND thread_id = $4 AND business_connection_id = $5 AND destiny = $6
+"""
+SELECT_SQL = """
+    SELECT state, data FROM fsm_storage
+    WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3 AND thread_id = $4 AND business_connection_id = $5 AND destiny = $6
+      AND updated_at > NOW() - $7 * INTERVAL '1 second'
+"""
+
+
+def _row_key(key: StorageKey) -> RowKey:
+    return (key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.business_connection_id or '', key.destiny)
+
+
+# FSM-хранилище в PostgreSQL: чтения идут через ограниченный LRU-кэш,
+# записи копятся в памяти и сбрасываются пачкой в конце обработки обновления (FsmFlushMiddleware).
+# О сброшенных ключах узнают остальные экземпляры бота через NOTIFY и выкидывают их из своего кэша
+class PostgresStorage(BaseStorage):
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        cache_size: int = FSM_CACHE_SIZE,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        max_dirty: int = FSM_MAX_DIRTY,
+        state_ttl: int = FSM_STATE_TTL,
+        cleanup_interval: float = FSM_CLEANUP_INTERVAL
+    ):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.state_ttl = state_ttl
+        self.cleanup_interval = cleanup_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=state_ttl)
+        self._dirty: Dict[RowKey, Record] = {}
+        self._flushing: Dict[RowKey, Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._instance_id = uuid.uuid4().hex
+        db.subscribe('fsm_storage', self._on_changed)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        row_key = _row_key(key)
+        _, data = await self._load(row_key)
+        await self._store(row_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(_row_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        row_key = _row_key(key)
+        state, _ = await self._load(row_key)
+        await self._store(row_key, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(_row_key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить FSM-состояния при остановке: {e}", exc_info=True)
+
+    async def flush(self) -> None:
+        # При ошибке изменения возвращаются в очередь, а исключение уходит вызывающему
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._flushing, self._dirty = self._dirty, {}
+            upserts = [(*row_key, state, json.dumps(data, ensure_ascii=False, default=str))
+                       for row_key, (state, data) in self._flushing.items() if state or data]
+            deletes = [row_key for row_key, (state, data) in self._flushing.items() if not state and not data]
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        if upserts:
+                            await conn.executemany(UPSERT_SQL, upserts)
+                        if deletes:
+                            await conn.executemany(DELETE_SQL, deletes)
+                        keys = list(self._flushing)
+                        for start in range(0, len(keys), NOTIFY_KEYS_CHUNK):
+                            await notify_change(conn, 'fsm_storage', source=self._instance_id, keys=keys[start:start + NOTIFY_KEYS_CHUNK])
+            except Exception:
+                for row_key, record in self._flushing.items():
+                    self._dirty.setdefault(row_key, record)
+                raise
+            finally:
+                self._flushing = {}
+
+    async def cleanup_expired(self) -> int:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("DELETE FROM fsm_storage WHERE updated_at < NOW() - $1 * INTERVAL '1 second'", self.state_ttl)
+        return int(result.split()[-1])
+
+    async def _load(self, row_key: RowKey) -> Record:
+        record = self._dirty.get(row_key) or self._flushing.get(row_key)
+        if record is not None:
+            return record
+
+        record = self._cache.get(row_key)
+        if record is not MISSING:
+            return record
+
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(SELECT_SQL, *row_key, self.state_ttl)
+        record = (row['state'], json.loads(row['data'])) if row else (None, {})
+        self._cache.set(row_key, record)
+        return record
+
+    async def _store(self, row_key: RowKey, record: Record) -> None:
+        # Пока база недоступна, очередь не растёт дальше max_dirty: ошибка сброса уходит в обработчик
+        if len(self._dirty) >= self.max_dirty and row_key not in self._dirty:
+            await self.flush()
+        self._cache.set(row_key, record)
+        self._dirty[row_key] = record
+        self._ensure_worker()
+
+    def _on_changed(self, event: Optional[Dict]) -> None:
+        if event is None:
+            self._cache.clear()
+            return
+        if event.get('source') == self._instance_id:
+            return
+        for row_key in event.get('keys', []):
+            self._cache.pop(tuple(row_key))
+
+    def _ensure_worker(self) -> None:
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._worker(), name="fsm-storage-flush")
+
+    async def _worker(self) -> None:
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении FSM-состояний: {e}", exc_info=True)
+            if time.monotonic() - last_cleanup >= self.cleanup_interval:
+                last_cleanup = time.monotonic()
+                try:
+                    removed = await self.cleanup_expired()
+                    if removed:
+                        logger.info(f"Удалено просроченных FSM-состояний: {removed}")
+                except Exception as e:
+                    logger.error(f"Ошибка при очистке FSM-состояний: {e}", exc_info=True)
+
+
+def create_fsm_storage(pool: asyncpg.Pool) -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return PostgresStorage(pool)
@@ -0,0 +1,120 @@
+import hashlib
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, List, Tuple
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+# Произвольный ключ pg_advisory_lock, общий для всех процессов бота
+MIGRATIONS_LOCK_ID = 7_140_211_001
+# Ожидание блокировки опросом: висящий pg_advisory_lock держит снимок, и CREATE INDEX CONCURRENTLY
+# у владельца блокировки ждал бы его вечно — Postgres отвечает deadlock
+MIGRATIONS_LOCK_RETRY_DELAY = 0.5
+# Первая строка файла: миграция выполняется без транзакции, по одному оператору (нужно для CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+STATEMENT_END = re.compile(r';[ \t]*$', re.MULTILINE)
+CONCURRENT_INDEX = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE)
+
+# (версия — имя файла без .sql, контрольная сумма, SQL)
+Migration = Tuple[str, str, str]
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version TEXT PRIMARY KEY,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    if not os.path.isdir(directory):
+        return []
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.sql'):
+            continue
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append((filename[:-4], hashlib.sha256(sql.encode('utf-8')).hexdigest(), sql))
+    return migrations
+
+
+def _is_transactional(sql: str) -> bool:
+    return sql.split('\n', 1)[0].strip() != NO_TRANSACTION_MARKER
+
+
+def _split_statements(sql: str) -> List[str]:
+    # Разбор по «;» в конце строки: в таких миграциях не должно быть тел функций и DO-блоков
+    statements = []
+    for chunk in STATEMENT_END.split(sql):
+        code = [line for line in chunk.splitlines() if line.strip() and not line.strip().startswith('--')]
+        if code:
+            statements.append(chunk.strip())
+    return statements
+
+
+async def _apply(conn: asyncpg.Connection, version: str, checksum: str, sql: str) -> None:
+    if _is_transactional(sql):
+        async with conn.transaction():
+            await conn.execute(sql)
+            await conn.execute("INSERT INTO schema_migrations (version, checksum) VALUES ($1, $2)", version, checksum)
+        return
+    # Операторы должны быть идемпотентными (IF NOT EXISTS): после сбоя миграция повторяется целиком
+    for statement in _split_statements(sql):
+        await conn.execute(statement)
+    # IF NOT EXISTS пропускает индекс, оставшийся INVALID после прерванной сборки, — такую миграцию не засчитываем
+    invalid = await conn.fetchval(
+        """
+        SELECT string_agg(c.relname, ', ') FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY($1::text[]) AND NOT i.indisvalid
+        """,
+        CONCURRENT_INDEX.findall(sql)
+    )
+    if invalid:
+        raise RuntimeError(f"Миграция {version} не применена: индексы {invalid} в состоянии INVALID, удалите их через DROP INDEX и перезапустите бота")
+    await conn.execute("INSERT INTO schema_migrations (version, checksum) VALUES ($1, $2)", version, checksum)
+
+
+async def _applied_migrations(conn: asyncpg.Connection) -> Dict[str, str]:
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return {}
+    return {row['version']: row['checksum'] for row in await conn.fetch("SELECT version, checksum FROM schema_migrations")}
+
+
+def _pending(migrations: List[Migration], applied: Dict[str, str]) -> List[Migration]:
+    for version, checksum, _ in migrations:
+        if version in applied and applied[version] != checksum:
+            raise RuntimeError(f"Миграция {version} изменена после применения; изменения схемы оформляйте новой миграцией")
+    return [migration for migration in migrations if migration[0] not in applied]
+
+
+async def run_migrations(conn: asyncpg.Connection, directory: str = MIGRATIONS_DIR) -> List[str]:
+    migrations = load_migrations(directory)
+    # Быстрый путь: всё применено — один SELECT без блокировок
+    if not _pending(migrations, await _applied_migrations(conn)):
+        return []
+
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATIONS_LOCK_ID):
+        await asyncio.sleep(MIGRATIONS_LOCK_RETRY_DELAY)
+    try:
+        await conn.execute(CREATE_TABLE_SQL)
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        pending = _pending(migrations, await _applied_migrations(conn))
+        for version, checksum, sql in pending:
+            try:
+                await _apply(conn, version, checksum, sql)
+            except asyncpg.PostgresError as e:
+                # Подсказка из RAISE ... USING HINT иначе теряется в логах
+                hint = f" ({e.hint})" if getattr(e, 'hint', None) else ""
+                if not _is_transactional(sql):
+                    hint += "; прерванный CREATE INDEX CONCURRENTLY оставляет индекс INVALID, удалите его через DROP INDEX перед перезапуском"
+                raise RuntimeError(f"Миграция {version} не применена: {e}{hint}") from e
+            logger.info(f"Применена миграция {version}")
+        return [version for version, _, _ in pending]
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_ID)
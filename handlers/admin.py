@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+from html import escape
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
@@ -6,9 +8,12 @@ from aiogram.filters import Command
 from typing import Annotated
 import asyncpg
 from services.user_service import add_user, get_users_by_role, delete_user, get_user_by_id, get_user_by_telegram_id
-from services.recipe_service import get_recipe_by_id, get_recipe_logs, mark_recipe_as_used, update_recipe_item_quantity
-from keyboards.common import get_role_menu, get_recipe_actions_keyboard, get_item_edit_keyboard
-from utils.recipe_formatter import format_recipe_detail, format_recipe_logs
+from services.drug_service import add_drug
+from services.recipe_service import get_recipe_by_id, get_recipe_full, mark_recipe_as_used, update_recipe_item_quantity, find_recipe_id, search_recipes
+from keyboards.common import get_role_menu, get_recipe_actions_keyboard, get_item_edit_keyboard, get_search_pagination_keyboard
+from utils.recipe_formatter import format_recipe_detail, format_recipe_logs, format_recipe_status, format_doctor_name
+from utils.date_formatter import format_date
+from utils.pagination import page_cursor, parse_cursor_key
 from utils.message_splitter import split_long_message
 
 router = Router()
@@ -28,6 +33,60 @@ class EditQuantityStates(StatesGroup):
     waiting_for_new_quantity = State()
 
 
+class SearchRecipeStates(StatesGroup):
+    waiting_for_filters = State()
+
+
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_FILTER_KEYS = {
+    'препарат': 'drug',
+    'врач': 'doctor',
+    'комментарий': 'comment',
+    'с': 'date_from',
+    'по': 'date_to',
+}
+
+
+def parse_search_filters(text: str) -> dict:
+    # Строки вида «ключ: значение»; строка без ключа считается названием препарата
+    filters = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        key, sep, value = line.partition(":")
+        field = SEARCH_FILTER_KEYS.get(key.strip().lower()) if sep else None
+        if field is None:
+            field, value = 'drug', line
+        value = value.strip()
+        if not value:
+            continue
+        if field in ('date_from', 'date_to'):
+            parsed = datetime.strptime(value, '%d.%m.%Y')
+            # «по» включает весь указанный день
+            filters[field] = parsed + timedelta(days=1) if field == 'date_to' else parsed
+        else:
+            filters[field] = value
+    return filters
+
+
+async def show_search_page(message: Message, recipes: list, page: int, has_next: bool, edit: bool = False):
+    text = f"🔎 <b>Результаты поиска</b> | Страница {page + 1}\n\n"
+    for recipe in recipes:
+        status_emoji, status_text = format_recipe_status(recipe)
+        text += (
+            f"{status_emoji} <b>#{recipe['id']}</b> · {format_date(recipe['created_at'])} · {escape(format_doctor_name(recipe))}\n"
+            f"🧾 {escape(recipe['external_id'] or '—')} · 💊 {recipe['items_count']} · {status_text}\n\n"
+        )
+    text += "Подробности: «🔍 Найти рецепт» и ID"
+
+    keyboard = get_search_pagination_keyboard(page, has_next)
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    else:
+        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
 @router.message(F.text == "➕ Добавить пользователя")
 async def cmd_add_user(message: Message, state: FSMContext, user: dict):
     await message.answer("➕ <b>Добавление пользователя</b>\n\n📝 Введите user_id (число):", parse_mode="HTML")
@@ -139,24 +198,40 @@ async def cmd_delete_user(message: Message, user: dict, db_pool: Annotated[async
         await message.answer("❌ Неверный формат user_id")
 
 
+@router.message(Command("add_drug"))
+async def cmd_add_drug(message: Message, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    # Справочник пополняется только вручную: свободный ввод врачей в подсказки не попадает
+    parts = message.text.split(maxsplit=1)
+    if len(parts) != 2 or not parts[1].strip():
+        await message.answer("Использование: /add_drug <название препарата>")
+        return
+    
+    name = " ".join(parts[1].split())
+    drug = await add_drug(name, db_pool)
+    if drug:
+        await message.answer(f"✅ Препарат «{drug['name']}» добавлен в справочник")
+    else:
+        await message.answer(f"ℹ️ Препарат «{name}» уже есть в справочнике")
+
+
 @router.message(F.text == "🔍 Найти рецепт")
 async def cmd_find_recipe(message: Message, state: FSMContext, user: dict):
-    await message.answer("🔍 <b>Поиск рецепта</b>\n\n📝 Введите ID рецепта:", parse_mode="HTML")
+    await message.answer("🔍 <b>Поиск рецепта</b>\n\n📝 Введите ID рецепта или номер бланка:", parse_mode="HTML")
     await state.set_state(FindRecipeStates.waiting_for_recipe_id)
 
 
 @router.message(FindRecipeStates.waiting_for_recipe_id)
 async def process_find_recipe_id(message: Message, state: FSMContext, db_pool: Annotated[asyncpg.Pool, "db_pool"], user: dict):
-    try:
-        recipe_id = int(message.text.strip())
-    except ValueError:
-        await message.answer("❌ Введите число")
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("⚠️ Пожалуйста, введите ID рецепта или номер бланка:")
         return
     
-    recipe = await get_recipe_by_id(recipe_id, db_pool)
+    recipe_id = await find_recipe_id(query, db_pool)
+    recipe = await get_recipe_full(recipe_id, db_pool) if recipe_id is not None else None
     
     if not recipe:
-        await message.answer(f"❌ Рецепт с ID <code>{recipe_id}</code> не найден", parse_mode="HTML")
+        await message.answer(f"❌ Рецепт <code>{escape(query)}</code> не найден", parse_mode="HTML")
         await state.clear()
         return
     
@@ -165,19 +240,100 @@ async def process_find_recipe_id(message: Message, state: FSMContext, db_pool: A
     if recipe['status'] == 'active':
         await message.answer(recipe_text, reply_markup=get_recipe_actions_keyboard(recipe_id), parse_mode="HTML")
     else:
-        logs = await get_recipe_logs(recipe_id, db_pool)
-        await message.answer(recipe_text + format_recipe_logs(logs), parse_mode="HTML")
+        await message.answer(recipe_text + format_recipe_logs(recipe['logs']), parse_mode="HTML")
     
     await state.clear()
 
 
+@router.message(F.text == "🔎 Поиск рецептов")
+async def cmd_search_recipes(message: Message, state: FSMContext, user: dict):
+    await message.answer(
+        "🔎 <b>Поиск рецептов</b>\n\n"
+        "📝 Отправьте фильтры одним сообщением, каждый с новой строки (любые из них):\n\n"
+        "<code>препарат: парацетамол\n"
+        "врач: @username или часть ФИО\n"
+        "комментарий: текст\n"
+        "с: 01.09.2026\n"
+        "по: 30.09.2026</code>",
+        parse_mode="HTML"
+    )
+    await state.set_state(SearchRecipeStates.waiting_for_filters)
+
+
+@router.message(SearchRecipeStates.waiting_for_filters)
+async def process_search_filters(message: Message, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    query = (message.text or "").strip()
+    try:
+        filters = parse_search_filters(query)
+    except ValueError:
+        await message.answer("❌ Даты указываются в формате ДД.ММ.ГГГГ, попробуйте ещё раз:")
+        return
+    
+    if not filters:
+        await message.answer("⚠️ Укажите хотя бы один фильтр:")
+        return
+    
+    # На страницу запрашиваем на одну запись больше, чтобы узнать, есть ли следующая, без count(*)
+    recipes = await search_recipes(filters, db_pool, SEARCH_RESULTS_PER_PAGE + 1)
+    if not recipes:
+        await message.answer("📭 Ничего не найдено")
+        await state.clear()
+        return
+    
+    has_next = len(recipes) > SEARCH_RESULTS_PER_PAGE
+    recipes = recipes[:SEARCH_RESULTS_PER_PAGE]
+    # Данные остаются в FSM для перелистывания, само состояние ввода сбрасывается
+    await state.set_state(None)
+    await state.update_data(search_query=query, search_cursor=page_cursor(recipes), search_page=0)
+    await show_search_page(message, recipes, 0, has_next)
+
+
+@router.callback_query(F.data.startswith("search_page_"))
+async def handle_search_pagination(callback: CallbackQuery, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    data = await state.get_data()
+    cursor = data.get('search_cursor')
+    page = data.get('search_page', 0)
+    
+    if not cursor or not data.get('search_query'):
+        await callback.answer("Результаты устарели, повторите поиск", show_alert=True)
+        return
+    
+    filters = parse_search_filters(data['search_query'])
+    if callback.data == "search_page_prev" and page > 0:
+        page -= 1
+        recipes = await search_recipes(filters, db_pool, SEARCH_RESULTS_PER_PAGE, before=parse_cursor_key(cursor['first']))
+        has_next = True
+    elif callback.data == "search_page_next":
+        page += 1
+        recipes = await search_recipes(filters, db_pool, SEARCH_RESULTS_PER_PAGE + 1, after=parse_cursor_key(cursor['last']))
+        has_next = len(recipes) > SEARCH_RESULTS_PER_PAGE
+        recipes = recipes[:SEARCH_RESULTS_PER_PAGE]
+    else:
+        await callback.answer()
+        return
+    
+    if not recipes:
+        await callback.answer()
+        return
+    
+    await state.update_data(search_cursor=page_cursor(recipes), search_page=page)
+    await show_search_page(callback.message, recipes, page, has_next, edit=True)
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("mark_used_"))
 async def admin_mark_used_handler(callback: CallbackQuery, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
     recipe_id = int(callback.data.split("_")[-1])
     
     try:
-        await mark_recipe_as_used(recipe_id, user['id'], db_pool)
-        await callback.message.edit_text(f"✅ <b>Рецепт #{recipe_id} отмечен как списанный</b>", reply_markup=None, parse_mode="HTML")
+        if await mark_recipe_as_used(recipe_id, user['id'], db_pool):
+            await callback.message.edit_text(f"✅ <b>Рецепт #{recipe_id} отмечен как списанный</b>", reply_markup=None, parse_mode="HTML")
+        else:
+            await callback.message.edit_text(
+                f"⚠️ <b>Рецепт #{recipe_id} не списан:</b> он уже списан или больше не активен",
+                reply_markup=None,
+                parse_mode="HTML"
+            )
     except Exception as e:
         await callback.message.edit_text(f"❌ Ошибка: {str(e)}", reply_markup=None)
     
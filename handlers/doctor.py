@@ -4,12 +4,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from typing import Annotated
 import asyncpg
-import re
 import logging
-from services.recipe_service import get_recipe_by_id, get_recipes_by_doctor, update_recipe_item_quantity, is_duplicate, get_recipe_logs
-from keyboards.common import get_duration_keyboard, get_recipe_items_actions_keyboard, get_confirm_keyboard, get_item_delete_keyboard, get_doctor_recipe_actions_keyboard, get_item_edit_keyboard, get_role_menu, get_recipes_pagination_keyboard
-from utils.recipe_formatter import format_recipe_detail, format_recipe_logs
-from utils.date_formatter import format_datetime, format_duration_days, format_recipe_status
+from services.recipe_service import get_recipe_by_id, get_recipes_page_by_doctor, count_recipes_by_doctor, update_recipe_item_quantity, is_duplicate, get_recipe_full, create_recipe
+from services.drug_service import suggest_drugs, get_drug_name
+from keyboards.common import get_drug_suggestions_keyboard, get_duration_keyboard, get_recipe_items_actions_keyboard, get_confirm_keyboard, get_item_delete_keyboard, get_doctor_recipe_actions_keyboard, get_item_edit_keyboard, get_role_menu, get_recipes_pagination_keyboard
+from utils.recipe_formatter import format_recipe_detail, format_recipe_logs, format_recipe_status
+from utils.date_formatter import format_datetime, format_duration_days
+from utils.pagination import page_cursor, parse_cursor_key
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -76,18 +77,59 @@ async def process_recipe_id(message: Message, state: FSMContext, db_pool: Annota
     await state.set_state(AddRecipeStates.waiting_for_drug_name)
 
 
+async def _add_drug_item(state: FSMContext, drug_name: str) -> str:
+    data = await state.get_data()
+    data.setdefault('items', []).append({'drug_name': drug_name, 'quantity': None})
+    await state.update_data(items=data['items'], typed_drug_name=None)
+    await state.set_state(AddRecipeStates.waiting_for_quantity)
+    return f"💊 <b>{drug_name}</b>\n\nВведите количество:"
+
+
 @router.message(AddRecipeStates.waiting_for_drug_name)
-async def process_drug_name(message: Message, state: FSMContext, user: dict):
+async def process_drug_name(message: Message, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
     if _check_cancel(message.text):
         await _cancel_recipe_flow(message, state, user)
         return
     
+    if not message.text or not message.text.strip():
+        await message.answer("⚠️ Пожалуйста, введите название препарата:")
+        return
+    
     drug_name = message.text.strip()
+    suggestions = await suggest_drugs(drug_name, db_pool)
+    exact = next((drug for drug in suggestions if drug['name'].lower() == drug_name.lower()), None)
+    if exact or not suggestions:
+        await message.answer(await _add_drug_item(state, exact['name'] if exact else drug_name), parse_mode="HTML")
+        return
+    
+    # Состояние не меняется: можно нажать подсказку или просто ввести название заново
+    await state.update_data(typed_drug_name=drug_name)
+    await message.answer(
+        f"🔎 Похожие препараты из справочника для «{drug_name}».\n\nВыберите или оставьте как ввели:",
+        reply_markup=get_drug_suggestions_keyboard(suggestions)
+    )
+
+
+@router.callback_query(F.data.startswith("drug_pick_"), AddRecipeStates.waiting_for_drug_name)
+async def pick_suggested_drug(callback: CallbackQuery, state: FSMContext, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    drug_name = await get_drug_name(int(callback.data.split("_")[-1]), db_pool)
+    if not drug_name:
+        await callback.answer("Препарат удалён из справочника, выберите другой или введите название ещё раз", show_alert=True)
+        return
+    
+    await callback.message.edit_text(await _add_drug_item(state, drug_name), parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data == "drug_keep", AddRecipeStates.waiting_for_drug_name)
+async def keep_typed_drug(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    data.setdefault('items', []).append({'drug_name': drug_name, 'quantity': None})
-    await state.update_data(items=data['items'])
-    await message.answer(f"💊 <b>{drug_name}</b>\n\nВведите количество:", parse_mode="HTML")
-    await state.set_state(AddRecipeStates.waiting_for_quantity)
+    if not data.get('typed_drug_name'):
+        await callback.answer("Введите название препарата", show_alert=True)
+        return
+    
+    await callback.message.edit_text(await _add_drug_item(state, data['typed_drug_name']), parse_mode="HTML")
+    await callback.answer()
 
 
 @router.message(AddRecipeStates.waiting_for_quantity)
@@ -239,41 +281,12 @@ async def confirm_recipe(callback: CallbackQuery, state: FSMContext, user: dict,
         await state.clear()
         return
     
-    if await is_duplicate(external_recipe_id, db_pool):
-        await callback.message.edit_text(f"❌ <b>Ошибка!</b>\n\nРецепт с ID <code>{external_recipe_id}</code> уже существует.\n\n🔒 Повторная выдача запрещена.", parse_mode="HTML")
-        await state.clear()
-        return
-    
     try:
-        async with db_pool.acquire() as conn:
-            async with conn.transaction():
-                recipe_id = await conn.fetchval(
-                    "INSERT INTO recipes (doctor_id, duration_days, comment, status, external_id) VALUES ($1::integer, $2::integer, $3::text, 'active', $4::text) RETURNING id",
-                    int(user['id']), int(duration_days), comment if comment else None, external_recipe_id
-                )
-                
-                for item in items:
-                    drug_name = item.get('drug_name', '')
-                    if not drug_name:
-                        continue
-                    
-                    quantity = item.get('quantity', '')
-                    if quantity is None or quantity == '':
-                        quantity_value = 0
-                    elif isinstance(quantity, (int, float)):
-                        quantity_value = int(quantity)
-                    elif isinstance(quantity, str):
-                        numbers = re.findall(r'\d+', str(quantity))
-                        quantity_value = int(numbers[0]) if numbers else 0
-                    else:
-                        quantity_value = 0
-                    
-                    await conn.execute(
-                        "INSERT INTO recipe_items (recipe_id, drug_name, quantity) VALUES ($1::integer, $2::text, $3::integer)",
-                        int(recipe_id), str(drug_name), int(quantity_value)
-                    )
-        
-        await callback.message.edit_text(f"✅ <b>Рецепт успешно создан!</b>\n\n🆔 <b>ID рецепта:</b> <code>{external_recipe_id}</code>\n\nРецепт сохранён в базу данных.", parse_mode="HTML")
+        recipe_id = await create_recipe(external_recipe_id, int(user['id']), int(duration_days), comment, items, db_pool)
+        if recipe_id is None:
+            await callback.message.edit_text(f"❌ <b>Ошибка!</b>\n\nРецепт с ID <code>{external_recipe_id}</code> уже существует.\n\n🔒 Повторная выдача запрещена.", parse_mode="HTML")
+        else:
+            await callback.message.edit_text(f"✅ <b>Рецепт успешно создан!</b>\n\n🆔 <b>ID рецепта:</b> <code>{external_recipe_id}</code>\n\nРецепт сохранён в базу данных.", parse_mode="HTML")
     except Exception as e:
         logger.error(f"Ошибка при создании рецепта: {e}", exc_info=True)
         await callback.message.edit_text(f"❌ Ошибка при создании рецепта: {str(e)}\n\nПопробуйте создать рецепт заново.")
@@ -289,18 +302,15 @@ async def cancel_recipe(callback: CallbackQuery, state: FSMContext, user: dict):
     await callback.answer()
 
 
-async def show_recipes_page(message: Message, recipes: list, page: int, edit_message: CallbackQuery = None, show_id_prompt: bool = False):
-    total_pages = (len(recipes) + RECIPES_PER_PAGE - 1) // RECIPES_PER_PAGE
-    start_idx = page * RECIPES_PER_PAGE
-    end_idx = min(start_idx + RECIPES_PER_PAGE, len(recipes))
-    page_recipes = recipes[start_idx:end_idx]
+async def show_recipes_page(message: Message, recipes: list, page: int, total: int, edit_message: CallbackQuery = None, show_id_prompt: bool = False):
+    total_pages = (total + RECIPES_PER_PAGE - 1) // RECIPES_PER_PAGE
     
-    text = f"📋 <b>Мои рецепты</b>\n\n📊 Всего: {len(recipes)} | Страница {page + 1}/{total_pages}\n\n━━━━━━━━━━━━━━━━━━━━\n\n"
+    text = f"📋 <b>Мои рецепты</b>\n\n📊 Всего: {total} | Страница {page + 1}/{total_pages}\n\n━━━━━━━━━━━━━━━━━━━━\n\n"
     
-    for recipe in page_recipes:
+    for recipe in recipes:
         status_emoji, status_text = format_recipe_status(recipe)
         duration_text = format_duration_days(recipe['duration_days'])
-        text += f"{status_emoji} <b>Рецепт #{recipe['id']}</b>\n📅 Дата: {format_datetime(recipe['created_at'])}\n⏱ Длительность: {duration_text}\n📊 Статус: {status_text}\n💊 Препараты: {len(recipe['items'])}\n━━━━━━━━━━━━━━━━━━━━\n\n"
+        text += f"{status_emoji} <b>Рецепт #{recipe['id']}</b>\n📅 Дата: {format_datetime(recipe['created_at'])}\n⏱ Длительность: {duration_text}\n📊 Статус: {status_text}\n💊 Препараты: {recipe['items_count']}\n━━━━━━━━━━━━━━━━━━━━\n\n"
     
     keyboard = get_recipes_pagination_keyboard(page, total_pages)
     
@@ -314,35 +324,47 @@ async def show_recipes_page(message: Message, recipes: list, page: int, edit_mes
 
 
 @router.callback_query(F.data.startswith("recipes_page_"))
-async def handle_recipes_pagination(callback: CallbackQuery, state: FSMContext, user: dict):
+async def handle_recipes_pagination(callback: CallbackQuery, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
     data = await state.get_data()
-    recipes = data.get('all_recipes', [])
+    cursor = data.get('recipes_cursor')
     current_page = data.get('current_page', 0)
-    total_pages = (len(recipes) + RECIPES_PER_PAGE - 1) // RECIPES_PER_PAGE
+    total = data.get('recipes_total', 0)
+    total_pages = (total + RECIPES_PER_PAGE - 1) // RECIPES_PER_PAGE
+    
+    if not cursor:
+        await callback.answer("Список устарел, откройте «📋 Мои рецепты» заново", show_alert=True)
+        return
     
-    if callback.data == "recipes_page_prev":
-        new_page = max(0, current_page - 1)
-    elif callback.data == "recipes_page_next":
-        new_page = min(total_pages - 1, current_page + 1)
+    if callback.data == "recipes_page_prev" and current_page > 0:
+        new_page = current_page - 1
+        recipes = await get_recipes_page_by_doctor(user['id'], db_pool, RECIPES_PER_PAGE, before=parse_cursor_key(cursor['first']))
+    elif callback.data == "recipes_page_next" and current_page < total_pages - 1:
+        new_page = current_page + 1
+        recipes = await get_recipes_page_by_doctor(user['id'], db_pool, RECIPES_PER_PAGE, after=parse_cursor_key(cursor['last']))
     else:
         await callback.answer()
         return
     
-    await state.update_data(current_page=new_page)
-    await show_recipes_page(None, recipes, new_page, edit_message=callback)
+    if not recipes:
+        await callback.answer()
+        return
+    
+    await state.update_data(recipes_cursor=page_cursor(recipes), current_page=new_page)
+    await show_recipes_page(None, recipes, new_page, total, edit_message=callback)
 
 
 @router.message(F.text == "📋 Мои рецепты")
 async def cmd_my_recipes(message: Message, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
-    recipes = await get_recipes_by_doctor(user['id'], db_pool)
+    recipes = await get_recipes_page_by_doctor(user['id'], db_pool, RECIPES_PER_PAGE)
     
     if not recipes:
         await message.answer("📭 У вас пока нет рецептов", parse_mode="HTML")
         return
     
-    await state.update_data(all_recipes=recipes, current_page=0)
+    total = await count_recipes_by_doctor(user['id'], db_pool)
+    await state.update_data(recipes_cursor=page_cursor(recipes), current_page=0, recipes_total=total)
     await state.set_state(DoctorRecipeStates.waiting_for_recipe_id)
-    await show_recipes_page(message, recipes, 0, show_id_prompt=True)
+    await show_recipes_page(message, recipes, 0, total, show_id_prompt=True)
 
 
 @router.message(DoctorRecipeStates.waiting_for_recipe_id)
@@ -353,7 +375,7 @@ async def process_doctor_recipe_id(message: Message, state: FSMContext, user: di
         await message.answer("❌ Введите число")
         return
     
-    recipe = await get_recipe_by_id(recipe_id, db_pool)
+    recipe = await get_recipe_full(recipe_id, db_pool)
     
     if not recipe or recipe['doctor_id'] != user['id']:
         await message.answer("❌ Рецепт не найден или доступ запрещён", parse_mode="HTML")
@@ -365,8 +387,7 @@ async def process_doctor_recipe_id(message: Message, state: FSMContext, user: di
     if recipe['status'] == 'active':
         await message.answer(recipe_text, reply_markup=get_doctor_recipe_actions_keyboard(recipe_id), parse_mode="HTML")
     else:
-        logs = await get_recipe_logs(recipe_id, db_pool)
-        await message.answer(recipe_text + format_recipe_logs(logs), parse_mode="HTML")
+        await message.answer(recipe_text + format_recipe_logs(recipe['logs']), parse_mode="HTML")
     
     await state.clear()
 
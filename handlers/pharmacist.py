@@ -1,12 +1,18 @@
+import re
+from html import escape
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from typing import Annotated
 import asyncpg
-from services.recipe_service import get_recipe_by_id, mark_recipe_as_used, update_recipe_item_quantity, get_recipe_logs
-from keyboards.common import get_recipe_actions_keyboard, get_item_edit_keyboard
-from utils.recipe_formatter import format_recipe_detail, format_recipe_logs, format_recipe_items
+from config import BATCH_DISPENSE_MAX_SIZE
+from services.recipe_service import (
+    get_recipe_by_id, mark_recipe_as_used, update_recipe_item_quantity, get_recipe_full,
+    get_recipes_for_dispense, mark_recipes_as_used_batch, find_recipe_id, MAX_RECIPE_ID
+)
+from keyboards.common import get_recipe_actions_keyboard, get_item_edit_keyboard, get_batch_dispense_confirm_keyboard
+from utils.recipe_formatter import format_recipe_detail, format_recipe_logs, format_recipe_items, format_batch_dispense_summary
 
 router = Router()
 
@@ -19,23 +25,42 @@ class EditQuantityStates(StatesGroup):
     waiting_for_new_quantity = State()
 
 
+class BatchDispenseStates(StatesGroup):
+    waiting_for_recipe_ids = State()
+    waiting_for_confirm = State()
+
+
+def parse_recipe_ids(text: str) -> list:
+    # Порядок сохраняется, повторы отбрасываются
+    ids = []
+    for token in re.split(r"[\s,;]+", text.strip()):
+        if not token:
+            continue
+        recipe_id = int(token.lstrip("#"))
+        if not 0 < recipe_id <= MAX_RECIPE_ID:
+            raise ValueError(f"Некорректный ID рецепта: {token}")
+        if recipe_id not in ids:
+            ids.append(recipe_id)
+    return ids
+
+
 @router.message(F.text == "🔍 Проверить рецепт")
 async def cmd_check_recipe(message: Message, state: FSMContext, user: dict):
-    await message.answer("🔍 <b>Проверка рецепта</b>\n\n📝 Введите ID рецепта:", parse_mode="HTML")
+    await message.answer("🔍 <b>Проверка рецепта</b>\n\n📝 Введите ID рецепта или номер бланка:", parse_mode="HTML")
     await state.set_state(CheckRecipeStates.waiting_for_recipe_id)
 
 
 @router.message(CheckRecipeStates.waiting_for_recipe_id)
 async def process_recipe_id(message: Message, state: FSMContext, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
-    try:
-        recipe_id = int(message.text.strip())
-    except ValueError:
-        await message.answer("❌ Введите число")
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("⚠️ Пожалуйста, введите ID рецепта или номер бланка:")
         return
     
-    recipe = await get_recipe_by_id(recipe_id, db_pool)
+    recipe_id = await find_recipe_id(query, db_pool)
+    recipe = await get_recipe_full(recipe_id, db_pool) if recipe_id is not None else None
     if not recipe:
-        await message.answer(f"❌ Рецепт с ID <code>{recipe_id}</code> не найден", parse_mode="HTML")
+        await message.answer(f"❌ Рецепт <code>{escape(query)}</code> не найден", parse_mode="HTML")
         await state.clear()
         return
     
@@ -44,8 +69,7 @@ async def process_recipe_id(message: Message, state: FSMContext, db_pool: Annota
     if recipe['status'] == 'active':
         await message.answer(recipe_text, reply_markup=get_recipe_actions_keyboard(recipe_id), parse_mode="HTML")
     else:
-        logs = await get_recipe_logs(recipe_id, db_pool)
-        await message.answer(recipe_text + format_recipe_logs(logs), parse_mode="HTML")
+        await message.answer(recipe_text + format_recipe_logs(recipe['logs']), parse_mode="HTML")
     
     await state.clear()
 
@@ -59,14 +83,88 @@ async def mark_used_handler(callback: CallbackQuery, user: dict, db_pool: Annota
     recipe_id = int(callback.data.split("_")[-1])
     
     try:
-        await mark_recipe_as_used(recipe_id, user['id'], db_pool)
-        await callback.message.edit_text(f"✅ <b>Рецепт #{recipe_id} отмечен как списанный</b>", reply_markup=None, parse_mode="HTML")
+        if await mark_recipe_as_used(recipe_id, user['id'], db_pool):
+            await callback.message.edit_text(f"✅ <b>Рецепт #{recipe_id} отмечен как списанный</b>", reply_markup=None, parse_mode="HTML")
+        else:
+            await callback.message.edit_text(
+                f"⚠️ <b>Рецепт #{recipe_id} не списан:</b> он уже списан или больше не активен",
+                reply_markup=None,
+                parse_mode="HTML"
+            )
     except Exception as e:
         await callback.message.edit_text(f"❌ Ошибка: {str(e)}", reply_markup=None)
     
     await callback.answer()
 
 
+@router.message(F.text == "📦 Списать несколько рецептов")
+async def cmd_batch_dispense(message: Message, state: FSMContext, user: dict):
+    await message.answer(
+        "📦 <b>Списание нескольких рецептов</b>\n\n"
+        f"📝 Отправьте ID рецептов одним сообщением через запятую или с новой строки (не больше {BATCH_DISPENSE_MAX_SIZE}):",
+        parse_mode="HTML"
+    )
+    await state.set_state(BatchDispenseStates.waiting_for_recipe_ids)
+
+
+@router.message(BatchDispenseStates.waiting_for_recipe_ids)
+async def process_batch_recipe_ids(message: Message, state: FSMContext, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    try:
+        recipe_ids = parse_recipe_ids(message.text or "")
+    except ValueError:
+        await message.answer("❌ ID рецептов должны быть положительными числами, попробуйте ещё раз:")
+        return
+
+    if not recipe_ids:
+        await message.answer("⚠️ Пожалуйста, введите хотя бы один ID:")
+        return
+    if len(recipe_ids) > BATCH_DISPENSE_MAX_SIZE:
+        await message.answer(f"⚠️ Слишком много рецептов за раз: {len(recipe_ids)}. Максимум - {BATCH_DISPENSE_MAX_SIZE}.")
+        return
+
+    recipes = await get_recipes_for_dispense(recipe_ids, db_pool)
+    summary = format_batch_dispense_summary(recipe_ids, recipes)
+    active_ids = [recipe_id for recipe_id in recipe_ids if recipe_id in recipes and recipes[recipe_id]['status'] == 'active']
+
+    if not active_ids:
+        await message.answer(summary + "\n\n❌ Нет рецептов, которые можно списать", parse_mode="HTML")
+        await state.clear()
+        return
+
+    await state.update_data(batch_recipe_ids=active_ids)
+    await state.set_state(BatchDispenseStates.waiting_for_confirm)
+    await message.answer(summary, reply_markup=get_batch_dispense_confirm_keyboard(), parse_mode="HTML")
+
+
+@router.callback_query(BatchDispenseStates.waiting_for_confirm, F.data == "batch_confirm")
+async def confirm_batch_dispense(callback: CallbackQuery, state: FSMContext, user: dict, db_pool: Annotated[asyncpg.Pool, "db_pool"]):
+    data = await state.get_data()
+    recipe_ids = data.get('batch_recipe_ids', [])
+    await state.clear()
+
+    try:
+        used_ids = await mark_recipes_as_used_batch(recipe_ids, user['id'], db_pool)
+    except Exception as e:
+        await callback.message.edit_text(f"❌ Ошибка: {str(e)}", reply_markup=None)
+        await callback.answer()
+        return
+
+    text = f"✅ <b>Списано рецептов: {len(used_ids)} из {len(recipe_ids)}</b>"
+    used = set(used_ids)
+    skipped = [f"#{recipe_id}" for recipe_id in recipe_ids if recipe_id not in used]
+    if skipped:
+        text += f"\n\n⚠️ Не списаны (статус изменился или срок истёк): {', '.join(skipped)}"
+    await callback.message.edit_text(text, reply_markup=None, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(BatchDispenseStates.waiting_for_confirm, F.data == "batch_cancel")
+async def cancel_batch_dispense(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.message.edit_text("❌ Списание отменено", reply_markup=None)
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("edit_quantity_"))
 async def edit_quantity_select(callback: CallbackQuery, state: FSMContext, db_pool: Annotated[asyncpg.Pool, "db_pool"], user: dict):
     if user.get('role') not in ['pharmacist', 'admin']:
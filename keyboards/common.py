@@ -7,14 +7,16 @@ def get_role_menu(role: str) -> ReplyKeyboardMarkup:
             [KeyboardButton(text="➕ Добавить пользователя")],
             [KeyboardButton(text="👥 Список пользователей")],
             [KeyboardButton(text="➕ Добавить рецепт")],
-            [KeyboardButton(text="🔍 Найти рецепт")]
+            [KeyboardButton(text="🔍 Найти рецепт")],
+            [KeyboardButton(text="🔎 Поиск рецептов")]
         ],
         'doctor': [
             [KeyboardButton(text="➕ Добавить рецепт")],
             [KeyboardButton(text="📋 Мои рецепты")]
         ],
         'pharmacist': [
-            [KeyboardButton(text="🔍 Проверить рецепт")]
+            [KeyboardButton(text="🔍 Проверить рецепт")],
+            [KeyboardButton(text="📦 Списать несколько рецептов")]
         ]
     }
     
@@ -40,6 +42,12 @@ def get_recipe_items_actions_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+def get_drug_suggestions_keyboard(drugs: list) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=f"💊 {drug['name']}", callback_data=f"drug_pick_{drug['id']}")] for drug in drugs]
+    buttons.append([InlineKeyboardButton(text="✍️ Оставить как ввели", callback_data="drug_keep")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def get_confirm_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_recipe"),
@@ -54,6 +62,13 @@ def get_recipe_actions_keyboard(recipe_id: int) -> InlineKeyboardMarkup:
     ])
 
 
+def get_batch_dispense_confirm_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Списать все", callback_data="batch_confirm"),
+        InlineKeyboardButton(text="❌ Отменить", callback_data="batch_cancel")
+    ]])
+
+
 def get_doctor_recipe_actions_keyboard(recipe_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✏️ Изменить количество", callback_data=f"edit_quantity_{recipe_id}")]
@@ -85,3 +100,12 @@ def get_recipes_pagination_keyboard(current_page: int, total_pages: int) -> Inli
         row.append(InlineKeyboardButton(text="Вперед ▶️", callback_data="recipes_page_next"))
     
     return InlineKeyboardMarkup(inline_keyboard=[row] if row else [])
+
+
+def get_search_pagination_keyboard(current_page: int, has_next: bool) -> InlineKeyboardMarkup:
+    row = []
+    if current_page > 0:
+        row.append(InlineKeyboardButton(text="◀️ Назад", callback_data="search_page_prev"))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Вперед ▶️", callback_data="search_page_next"))
+    return InlineKeyboardMarkup(inline_keyboard=[row] if row else [])
@@ -1,68 +1,47 @@
 import asyncio
+import asyncpg
 import logging
+import signal
 import sys
-import threading
 from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import BOT_TOKEN, BOT_MODE, WEB_HOST, WEB_PORT, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET
 from db.database import db
+from db.fsm_storage import PostgresStorage, create_fsm_storage
 from handlers import common, admin, doctor, pharmacist
 from middlewares.database import DatabaseMiddleware
+from middlewares.fsm_flush import FsmFlushMiddleware
+from middlewares.health import UpdateTrackerMiddleware, PollingHeartbeatMiddleware
+from middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, TelegramApiMetricsMiddleware
 from middlewares.logging import LoggingMiddleware
+from middlewares.outbound import OutboundLimiterMiddleware
 from middlewares.role_check import RoleCheckMiddleware
+from middlewares.throttling import ThrottlingMiddleware
 from middlewares.unregistered import UnregisteredUserMiddleware
+from server.app import create_app
+from services.expiry_service import run_expiry_sweeper
+from services.drug_service import warm_up_drug_index
+from services.recipe_service import warm_up_external_ids
+from utils.log_setup import setup_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-async def healthcheck(request):
-    return web.Response(text="OK")
-
-
-def run_health_server():
-    async def init():
-        app = web.Application()
-        app.router.add_get('/', healthcheck)
-        app.router.add_get('/health', healthcheck)
-        return app
-    
-    async def run():
-        app = await init()
-        runner = web.AppRunner(app)
-        await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', 8080)
-        await site.start()
-        print("Health check server started on port 8080")
-        try:
-            while True:
-                await asyncio.sleep(3600)
-        except asyncio.CancelledError:
-            pass
-    
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(run())
-    except KeyboardInterrupt:
-        pass
-    finally:
-        loop.close()
-
-
-health_thread = threading.Thread(target=run_health_server, daemon=True, name="HealthServer")
-health_thread.start()
-
-
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-
-    logger.info("Подключение к базе данных...")
-    pool = await db.connect()
-    logger.info("База данных подключена")
+def build_dispatcher(pool: asyncpg.Pool, storage: BaseStorage) -> Dispatcher:
+    # Роутеры — синглтоны модулей, поэтому диспетчер собирается один раз на процесс
+    dp = Dispatcher(storage=storage)
 
+    dp.update.outer_middleware(UpdateTrackerMiddleware())
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    if isinstance(storage, PostgresStorage):
+        dp.update.outer_middleware(FsmFlushMiddleware(storage))
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    dp.message.middleware(HandlerMetricsMiddleware('message'))
+    dp.callback_query.middleware(HandlerMetricsMiddleware('callback_query'))
     dp.message.middleware(DatabaseMiddleware(pool))
     dp.callback_query.middleware(DatabaseMiddleware(pool))
     dp.message.middleware(LoggingMiddleware())
@@ -83,20 +62,74 @@ async def main():
     dp.include_router(pharmacist.router)
     dp.include_router(doctor.router)
     dp.include_router(admin.router)
+    return dp
 
-    logger.info("Бот запущен")
+
+async def main():
+    bot = Bot(token=BOT_TOKEN)
+    # Первым в цепочке: метрики ниже замеряют сам запрос к API, без ожидания в очереди
+    outbound = OutboundLimiterMiddleware()
+    bot.session.middleware(outbound)
+    bot.session.middleware(PollingHeartbeatMiddleware())
+    bot.session.middleware(TelegramApiMetricsMiddleware())
+
+    logger.info("Подключение к базе данных...")
+    pool = await db.connect()
+    logger.info("База данных подключена")
+
+    storage = create_fsm_storage(pool)
+    dp = build_dispatcher(pool, storage)
+
+    app = create_app()
+    if BOT_MODE == "webhook":
+        # Обновления обрабатываются фоновыми задачами, Telegram сразу получает 200
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET, handle_in_background=True).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEB_HOST, WEB_PORT).start()
+    logger.info(f"HTTP-сервер запущен на {WEB_HOST}:{WEB_PORT}")
+
+    expiry_task = asyncio.create_task(run_expiry_sweeper(pool), name="expiry-sweeper")
+    # Прогрев фильтра не задерживает старт: пока он идёт, проверка дубликатов ходит в базу
+    warm_up_task = asyncio.create_task(warm_up_external_ids(pool), name="external-ids-warm-up")
+    drugs_warm_up_task = asyncio.create_task(warm_up_drug_index(pool), name="drug-index-warm-up")
+
+    logger.info(f"Бот запущен в режиме {BOT_MODE}")
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            await bot.set_webhook(
+                f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            # В режиме polling сигналы ловит aiogram; здесь без обработчика SIGTERM (docker stop) finally не выполнится
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, stop_event.set)
+            await stop_event.wait()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
         logger.error(f"Ошибка при работе бота: {e}", exc_info=True)
         raise
     finally:
         logger.info("Завершение работы бота...")
+        expiry_task.cancel()
+        warm_up_task.cancel()
+        drugs_warm_up_task.cancel()
+        await runner.cleanup()
+        await storage.close()
         await db.disconnect()
+        await outbound.close()
         await bot.session.close()
 
 
 if __name__ == "__main__":
+    log_listener = setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -104,3 +137,5 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        log_listener.stop()
@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from db.fsm_storage import PostgresStorage
+
+
+class FsmFlushMiddleware(BaseMiddleware):
+    # Состояние сохраняется до завершения обработки обновления: следующее обновление того же
+    # пользователя может попасть на другой экземпляр бота и должно увидеть актуальный шаг диалога
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            await self.storage.flush()
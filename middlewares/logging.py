@@ -1,8 +1,10 @@
 import logging
-from datetime import datetime
+import random
+import time
 from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
+from config import LOG_SAMPLE_RATES, LOG_SLOW_UPDATE_MS
 
 logger = logging.getLogger(__name__)
 
@@ -15,27 +17,44 @@ class LoggingMiddleware(BaseMiddleware):
         event: Any,
         data: Dict[str, Any]
     ) -> Any:
-        user_id = None
-        username = None
-        update_type = type(event).__name__
-        text = ""
-        
+        started = time.perf_counter()
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            update_type = "message" if isinstance(event, Message) else "callback_query" if isinstance(event, CallbackQuery) else type(event).__name__
+            # Ошибки и медленные обновления пишутся всегда, остальные — с заданной долей
+            if error or duration_ms >= LOG_SLOW_UPDATE_MS or random.random() < LOG_SAMPLE_RATES.get(update_type, 1.0):
+                self._log(event, data, update_type, duration_ms, error)
+
+    @staticmethod
+    def _log(event: Any, data: Dict[str, Any], update_type: str, duration_ms: float, error: Exception | None) -> None:
+        user = getattr(event, 'from_user', None)
         if isinstance(event, Message):
-            user_id = event.from_user.id if event.from_user else None
-            username = event.from_user.username if event.from_user else None
             text = event.text or event.caption or ""
         elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id if event.from_user else None
-            username = event.from_user.username if event.from_user else None
             text = event.data or ""
+        else:
+            text = ""
+        callback = getattr(data.get('handler'), 'callback', None)
         
-        log_message = (
-            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-            f"User: {user_id} (@{username}) | "
-            f"Type: {update_type} | "
-            f"Text: {text[:100]}"
+        handler_name = getattr(callback, '__qualname__', None)
+        user_id = user.id if user else None
+        logger.log(
+            logging.ERROR if error else logging.INFO,
+            "%s от %s -> %s за %.1f мс",
+            update_type, user_id, handler_name, duration_ms,
+            extra={
+                'user_id': user_id,
+                'username': user.username if user else None,
+                'update_type': update_type,
+                'handler': handler_name,
+                'duration_ms': round(duration_ms, 2),
+                'text': text[:100],
+                'error': repr(error) if error else None
+            }
         )
-        
-        logger.info(log_message)
-        
-        return await handler(event, data)
@@ -0,0 +1,61 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import Update
+from utils.metrics import UPDATES_RECEIVED, UPDATES_HANDLED, HANDLER_LATENCY, TELEGRAM_API_LATENCY, TELEGRAM_API_ERRORS
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        UPDATES_RECEIVED.inc(update_type=event.event_type)
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, update_type: str):
+        self.update_type = update_type
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', None)
+        handler_name = getattr(callback, '__name__', 'unknown')
+        router_name = getattr(callback, '__module__', 'unknown').rsplit('.', 1)[-1]
+
+        UPDATES_HANDLED.inc(update_type=self.update_type, router=router_name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, router=router_name, handler=handler_name)
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        method_name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(method=method_name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.observe(time.perf_counter() - started, method=method_name)
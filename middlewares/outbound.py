@@ -0,0 +1,205 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    TelegramMethod, EditMessageText, EditMessageReplyMarkup, EditMessageCaption, DeleteMessage
+)
+from aiogram.methods.base import Response, TelegramType
+from config import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_CHATS
+from utils.token_bucket import KeyedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Меньше — раньше: правки и удаления меняют то, что пользователь уже видит, новые сообщения идут следом
+PRIORITY_EDIT = 0
+PRIORITY_SEND = 1
+EDIT_METHODS = (EditMessageText, EditMessageReplyMarkup, EditMessageCaption)
+# Повторная правка того же сообщения тем же методом заменяет ещё не отправленную
+COALESCED_METHODS = (EditMessageText, EditMessageReplyMarkup)
+
+
+class _OutboundJob:
+    __slots__ = ('make_request', 'bot', 'method', 'chat_id', 'priority', 'seq', 'attempts', 'waiters', 'coalesce_key')
+
+    def __init__(self, make_request, bot: Bot, method: TelegramMethod, chat_id: Any, priority: int, seq: int):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.attempts = 0
+        self.waiters: List[asyncio.Future] = [asyncio.get_running_loop().create_future()]
+        self.coalesce_key: Optional[Tuple] = None
+
+    @property
+    def abandoned(self) -> bool:
+        return all(waiter.done() for waiter in self.waiters)
+
+    def resolve(self, result: Any) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def fail(self, error: BaseException) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    def cancel(self) -> None:
+        for waiter in self.waiters:
+            waiter.cancel()
+
+
+# Единая очередь исходящих запросов к Bot API для всех хендлеров: общий лимит на бота,
+# лимит на чат, повтор после 429 и склейка подряд идущих правок одного сообщения
+class OutboundLimiterMiddleware(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float = OUTBOUND_GLOBAL_RATE,
+        chat_rate: float = OUTBOUND_CHAT_RATE,
+        chat_burst: float = OUTBOUND_CHAT_BURST,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+        max_chats: int = OUTBOUND_MAX_CHATS
+    ):
+        self.max_retries = max_retries
+        self._global = KeyedTokenBucket(global_rate, global_rate, 1)
+        self._chats = KeyedTokenBucket(chat_rate, chat_burst, max_chats)
+        self._queue: List[Tuple[int, int, _OutboundJob]] = []
+        self._pending_edits: Dict[Tuple, _OutboundJob] = {}
+        # chat_id -> момент, до которого Telegram попросил не писать в чат
+        self._blocked_until: Dict[Any, float] = {}
+        self._in_flight: Set[asyncio.Task] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery и т.п. не расходуют лимит сообщений в чат
+            return await self._send_with_retry(make_request, bot, method)
+
+        priority = PRIORITY_EDIT if isinstance(method, EDIT_METHODS + (DeleteMessage,)) else PRIORITY_SEND
+        job = _OutboundJob(make_request, bot, method, chat_id, priority, next(self._seq))
+        waiter = job.waiters[0]
+        if isinstance(method, COALESCED_METHODS):
+            self._coalesce(job, (type(method), chat_id, method.message_id))
+        self._push(job)
+        return await waiter
+
+    def queue_size(self) -> int:
+        return len(self._queue)
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, job in self._queue:
+            job.cancel()
+        self._queue.clear()
+        self._pending_edits.clear()
+
+    async def _send_with_retry(self, make_request, bot: Bot, method: TelegramMethod) -> Any:
+        attempts = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempts += 1
+                if attempts > self.max_retries:
+                    raise
+                logger.warning(f"Flood control на {method.__api_method__}, повтор через {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+
+    def _coalesce(self, job: _OutboundJob, key: Tuple) -> None:
+        previous = self._pending_edits.get(key)
+        if previous is not None and not previous.abandoned:
+            self._queue.remove((previous.priority, previous.seq, previous))
+            job.waiters.extend(previous.waiters)
+            # Место в очереди остаётся за первой правкой, чтобы склейка не отодвигала её назад
+            job.seq = previous.seq
+        job.coalesce_key = key
+        self._pending_edits[key] = job
+
+    def _push(self, job: _OutboundJob) -> None:
+        bisect.insort(self._queue, (job.priority, job.seq, job))
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._worker(), name="outbound-limiter")
+        self._wakeup.set()
+
+    def _next_ready(self, now: float) -> Tuple[Optional[_OutboundJob], float]:
+        delay = self._global.wait_time(None, now)
+        if delay:
+            return None, delay
+
+        delay = float('inf')
+        for index, (_, _, job) in enumerate(self._queue):
+            if job.abandoned:
+                continue
+            wait = max(self._chats.wait_time(job.chat_id, now), self._blocked_until.get(job.chat_id, 0) - now)
+            if wait <= 0:
+                del self._queue[index]
+                return job, 0.0
+            delay = min(delay, wait)
+        return None, delay
+
+    async def _worker(self) -> None:
+        while True:
+            self._queue = [entry for entry in self._queue if not entry[2].abandoned]
+            if not self._queue:
+                self._pending_edits.clear()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            self._blocked_until = {chat: until for chat, until in self._blocked_until.items() if until > now}
+            job, delay = self._next_ready(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job.coalesce_key is not None and self._pending_edits.get(job.coalesce_key) is job:
+                del self._pending_edits[job.coalesce_key]
+            self._global.take(None, now)
+            self._chats.take(job.chat_id, now)
+            task = asyncio.create_task(self._execute(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, job: _OutboundJob) -> None:
+        try:
+            result = await job.make_request(job.bot, job.method)
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            if job.attempts > self.max_retries:
+                job.fail(e)
+                return
+            logger.warning(f"Flood control в чате {job.chat_id}, повтор через {e.retry_after} с")
+            self._blocked_until[job.chat_id] = time.monotonic() + e.retry_after
+            self._push(job)
+        except Exception as e:
+            job.fail(e)
+        else:
+            job.resolve(result)
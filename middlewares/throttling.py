@@ -0,0 +1,47 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+from config import THROTTLE_RATE, THROTTLE_BURST, THROTTLE_MAX_USERS, DEBOUNCE_WINDOW, DEBOUNCE_PREFIXES
+from utils.token_bucket import KeyedTokenBucket
+from utils.ttl_cache import TTLCache, MISSING
+from utils.user_extractor import extract_user_id
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: float = THROTTLE_BURST,
+        max_users: int = THROTTLE_MAX_USERS,
+        debounce_window: float = DEBOUNCE_WINDOW,
+        debounce_prefixes: Tuple[str, ...] = DEBOUNCE_PREFIXES
+    ):
+        self.debounce_prefixes = debounce_prefixes
+        self._buckets = KeyedTokenBucket(rate, burst, max_users)
+        self._recent_callbacks = TTLCache(maxsize=max_users, ttl=debounce_window)
+        super().__init__()
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        user_id = extract_user_id(event)
+        if user_id is None:
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery) and self._is_debounced(user_id, event.data or ""):
+            await event.answer("⏳ Уже обрабатывается")
+            return
+
+        if not self._buckets.take(user_id):
+            if isinstance(event, CallbackQuery):
+                await event.answer("⏳ Слишком часто, подождите немного")
+            return
+
+        return await handler(event, data)
+
+    def _is_debounced(self, user_id: int, callback_data: str) -> bool:
+        if not callback_data.startswith(self.debounce_prefixes):
+            return False
+        key = (user_id, callback_data)
+        if self._recent_callbacks.get(key) is not MISSING:
+            return True
+        self._recent_callbacks.set(key, True)
+        return False
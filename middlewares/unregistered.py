@@ -1,36 +1,58 @@
+from functools import lru_cache
 from typing import Callable, Awaitable, Dict, Any
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from services.user_service import get_user_by_telegram_id, get_users_by_role
+from config import UNREGISTERED_REPLY_INTERVAL, UNREGISTERED_REPLY_CACHE_SIZE
+from services.user_service import get_user_by_telegram_id, get_admins
 from utils.admin_formatter import format_admin_contacts
 from utils.messages import get_access_denied_message, get_user_id_message
 from utils.user_extractor import extract_user_id, extract_user_info
+from utils.ttl_cache import TTLCache, MISSING
 import asyncpg
 
+# Время последнего ответа «доступ запрещён» по telegram_id — общий для message и callback_query
+_denied_replies = TTLCache(maxsize=UNREGISTERED_REPLY_CACHE_SIZE, ttl=UNREGISTERED_REPLY_INTERVAL)
+
+
+@lru_cache(maxsize=16)
+def _render_access_denied(admin_usernames: tuple) -> str:
+    admins = [{'username': username} for username in admin_usernames]
+    return get_access_denied_message(format_admin_contacts(admins))
+
+
+async def _get_access_denied_text(pool: asyncpg.Pool) -> str:
+    admins = await get_admins(pool)
+    return _render_access_denied(tuple(admin['username'] for admin in admins))
+
 
 class UnregisteredUserMiddleware(BaseMiddleware):
     async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
         pool: asyncpg.Pool = data.get("db_pool")
         user_id = extract_user_id(event)
-        
+
         if not user_id or not pool:
             return await handler(event, data)
-        
+
         user = await get_user_by_telegram_id(user_id, pool)
-        
+
         if not user:
-            admins = await get_users_by_role('admin', pool)
-            admin_text = format_admin_contacts(admins)
+            if _denied_replies.get(user_id) is not MISSING:
+                if isinstance(event, CallbackQuery):
+                    await event.answer()
+                return
+            _denied_replies.set(user_id, True)
+
+            denied_text = await _get_access_denied_text(pool)
             user_full_name, user_username, _ = extract_user_info(event)
-            
+
             if isinstance(event, Message):
-                await event.answer(get_access_denied_message(admin_text), parse_mode="HTML")
+                await event.answer(denied_text, parse_mode="HTML")
                 await event.answer(get_user_id_message(user_full_name, user_username, user_id), parse_mode="HTML")
             elif isinstance(event, CallbackQuery):
-                await event.message.answer(get_access_denied_message(admin_text), parse_mode="HTML")
+                await event.message.answer(denied_text, parse_mode="HTML")
                 await event.message.answer(get_user_id_message(user_full_name, user_username, user_id), parse_mode="HTML")
                 await event.answer()
             return
-        
+
         data['user'] = user
         return await handler(event, data)
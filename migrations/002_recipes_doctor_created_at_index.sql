@@ -0,0 +1,2 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_doctor_created_at ON recipes(doctor_id, created_at, id);
@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    bot_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    thread_id BIGINT NOT NULL DEFAULT 0,
+    business_connection_id TEXT NOT NULL DEFAULT '',
+    destiny TEXT NOT NULL DEFAULT 'default',
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at);
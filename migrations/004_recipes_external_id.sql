@@ -0,0 +1,23 @@
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS external_id TEXT;
+
+-- Если колонку уже заполняли вручную, уникальный индекс (миграция 005) не построится: называем повторы заранее
+DO $$
+DECLARE
+    duplicates TEXT;
+BEGIN
+    SELECT string_agg(format('%s (рецепты %s)', external_id, ids), '; ')
+    INTO duplicates
+    FROM (
+        SELECT external_id, string_agg(id::text, ', ' ORDER BY id) AS ids
+        FROM recipes
+        WHERE external_id IS NOT NULL
+        GROUP BY external_id
+        HAVING count(*) > 1
+        ORDER BY external_id
+        LIMIT 20
+    ) d;
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'Номера бланков повторяются: %', duplicates
+            USING HINT = 'Оставьте у каждого номера один рецепт (UPDATE recipes SET external_id = NULL WHERE id = ...) и перезапустите бота';
+    END IF;
+END $$;
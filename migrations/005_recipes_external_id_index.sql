@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Повторы номеров бланков отсеивает миграция 004
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_external_id ON recipes(external_id);
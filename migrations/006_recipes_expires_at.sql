@@ -0,0 +1,13 @@
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP
+    GENERATED ALWAYS AS (created_at + duration_days * INTERVAL '1 day') STORED;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'recipes_status_check' AND pg_get_constraintdef(oid) LIKE '%expired%'
+    ) THEN
+        ALTER TABLE recipes DROP CONSTRAINT IF EXISTS recipes_status_check;
+        ALTER TABLE recipes ADD CONSTRAINT recipes_status_check CHECK (status IN ('active', 'used', 'expired'));
+    END IF;
+END $$;
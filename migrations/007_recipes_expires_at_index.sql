@@ -0,0 +1,2 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_active_expires_at ON recipes(expires_at) WHERE status = 'active';
@@ -0,0 +1,17 @@
+-- migrate: no-transaction
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS drugs (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_drugs_name_lower ON drugs (lower(name));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_drugs_name_trgm ON drugs USING gin (lower(name) gin_trgm_ops);
+
+-- Справочник заполняется уже выписанными препаратами; из разных написаний остаётся одно
+INSERT INTO drugs (name, usage_count)
+SELECT min(drug_name), count(*) FROM recipe_items GROUP BY lower(drug_name)
+ON CONFLICT DO NOTHING;
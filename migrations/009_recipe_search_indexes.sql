@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Поиск подстроки (LIKE '%...%') по препаратам и комментариям
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipe_items_drug_name_trgm ON recipe_items USING gin (lower(drug_name) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_comment_trgm ON recipes USING gin (lower(comment) gin_trgm_ops);
+
+-- Keyset-пагинация поиска без фильтра по врачу; с фильтром работает idx_recipes_doctor_created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_created_at_id ON recipes (created_at, id);
@@ -0,0 +1,43 @@
+from aiohttp import web
+from db.database import db
+from server.health import health_state
+from utils.metrics import REGISTRY, DB_POOL_CONNECTIONS
+from services.user_service import get_user_cache_stats
+from services.recipe_service import get_recipe_cache_stats, get_external_id_filter_stats
+from services.drug_service import get_drug_index_stats
+
+
+async def healthcheck(request):
+    return web.Response(text="OK")
+
+
+async def readiness(request):
+    result = await health_state.readiness()
+    return web.json_response(result, status=200 if result['ready'] else 503)
+
+
+async def cache_stats(request):
+    return web.json_response({**get_user_cache_stats(), 'recipes': get_recipe_cache_stats(), 'external_ids': get_external_id_filter_stats(), 'drugs': get_drug_index_stats()})
+
+
+async def pool_stats(request):
+    return web.json_response(db.get_pool_stats())
+
+
+async def metrics(request):
+    pool_stats = db.get_pool_stats()
+    for state in ('size', 'idle', 'acquired'):
+        if state in pool_stats:
+            DB_POOL_CONNECTIONS.set(pool_stats[state], state=state)
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get('/', healthcheck)
+    app.router.add_get('/health', healthcheck)
+    app.router.add_get('/ready', readiness)
+    app.router.add_get('/cache', cache_stats)
+    app.router.add_get('/pool', pool_stats)
+    app.router.add_get('/metrics', metrics)
+    return app
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from config import BOT_MODE, READY_CACHE_TTL, READY_DB_TIMEOUT, READY_MAX_POLL_AGE, READY_MAX_UPDATE_AGE
+from db.database import db
+
+
+class HealthState:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.last_update_at: Optional[float] = None
+        self.last_poll_at: Optional[float] = None
+        self._ready_result: Optional[Dict[str, Any]] = None
+        self._ready_checked_at = 0.0
+        self._ready_lock = asyncio.Lock()
+
+    def mark_update(self) -> None:
+        self.last_update_at = time.monotonic()
+
+    def mark_poll(self) -> None:
+        self.last_poll_at = time.monotonic()
+
+    async def readiness(self) -> Dict[str, Any]:
+        # Результат кэшируется, чтобы частые пробы не ходили в PostgreSQL на каждый запрос
+        async with self._ready_lock:
+            if self._ready_result is None or time.monotonic() - self._ready_checked_at >= READY_CACHE_TTL:
+                self._ready_result = await self._check()
+                self._ready_checked_at = time.monotonic()
+            return self._ready_result
+
+    async def _check(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        result: Dict[str, Any] = {'ready': True, 'mode': BOT_MODE}
+
+        try:
+            started = time.perf_counter()
+            async with db.pool.acquire(timeout=READY_DB_TIMEOUT) as conn:
+                await conn.fetchval("SELECT 1", timeout=READY_DB_TIMEOUT)
+            result['db'] = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as e:
+            result['db'] = {'ok': False, 'error': type(e).__name__}
+            result['ready'] = False
+
+        update_age = now - self.last_update_at if self.last_update_at else None
+        result['last_update_age'] = round(update_age, 1) if update_age is not None else None
+        if READY_MAX_UPDATE_AGE and (update_age or now - self.started_at) > READY_MAX_UPDATE_AGE:
+            result['ready'] = False
+
+        if BOT_MODE == "polling":
+            poll_age = now - (self.last_poll_at or self.started_at)
+            result['last_poll_age'] = round(poll_age, 1)
+            if poll_age > READY_MAX_POLL_AGE:
+                result['ready'] = False
+
+        return result
+
+
+health_state = HealthState()
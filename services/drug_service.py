@@ -0,0 +1,125 @@
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import asyncpg
+from config import DRUG_SUGGESTIONS_LIMIT
+from db.database import db, notify_change
+from utils.metrics import timed_db_call
+from utils.prefix_index import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+# Справочник препаратов в памяти: подсказки по префиксу без обращения к базе
+_drug_index = PrefixIndex()
+
+
+def index_drugs(drugs: List[Dict]) -> None:
+    for drug in drugs:
+        _drug_index.add(drug['id'], drug['name'], drug['usage_count'])
+
+
+def _on_drugs_changed(event: Optional[Dict]) -> None:
+    # usage_count в уведомлении абсолютный, поэтому повторная доставка ничего не портит;
+    # после переподключения LISTEN индекс может отстать до следующего старта — это влияет только на подсказки
+    if event and event.get('drugs'):
+        index_drugs(event['drugs'])
+
+
+db.subscribe('drugs', _on_drugs_changed)
+
+
+def get_drug_index_stats() -> Dict[str, Any]:
+    return {'size': len(_drug_index)}
+
+
+async def warm_up_drug_index(pool: asyncpg.Pool) -> int:
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT id, name, usage_count FROM drugs")
+    index_drugs([dict(row) for row in rows])
+    return len(_drug_index)
+
+
+@timed_db_call
+async def get_drug_name(drug_id: int, pool: asyncpg.Pool) -> Optional[str]:
+    drug = _drug_index.get(drug_id)
+    if drug:
+        return drug[0]
+    # Индекс ещё прогревается или пропустил уведомление: справочник в базе надёжнее
+    async with pool.acquire() as conn:
+        return await conn.fetchval("SELECT name FROM drugs WHERE id = $1", drug_id)
+
+
+@timed_db_call
+async def suggest_drugs(query: str, pool: asyncpg.Pool, limit: int = DRUG_SUGGESTIONS_LIMIT) -> List[Dict]:
+    matches = _drug_index.search(query, limit)
+    if matches:
+        return [{'id': drug_id, 'name': name, 'usage_count': weight} for drug_id, name, weight in matches]
+
+    # Префиксов не нашлось — возможно, опечатка: ищем похожие названия по триграммному индексу
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT id, name, usage_count FROM drugs
+            WHERE lower(name) % lower($1)
+            ORDER BY similarity(lower(name), lower($1)) DESC, usage_count DESC
+            LIMIT $2
+            """,
+            query, limit
+        )
+    return [dict(row) for row in rows]
+
+
+@timed_db_call
+async def record_drug_usage(drug_names: List[str], pool: asyncpg.Pool) -> List[Dict]:
+    # Отдельная короткая транзакция после COMMIT рецепта: счётчик справочника не должен
+    # ни блокировать, ни ронять создание рецепта. Обновляются только препараты, уже внесённые в справочник:
+    # свободно введённое название (в том числе с опечаткой) остаётся в позиции рецепта, а в справочник
+    # его добавляет администратор (/add_drug). Строки блокируются по id, чтобы параллельные вызовы не ловили deadlock
+    counts: Counter = Counter(name.strip().lower() for name in drug_names if name.strip())
+    if not counts:
+        return []
+
+    keys = sorted(counts)
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """
+                    WITH locked AS (
+                        SELECT d.id, t.usage_count
+                        FROM drugs d JOIN unnest($1::text[], $2::int[]) AS t(name, usage_count) ON lower(d.name) = t.name
+                        ORDER BY d.id
+                        FOR UPDATE OF d
+                    )
+                    UPDATE drugs SET usage_count = drugs.usage_count + locked.usage_count
+                    FROM locked
+                    WHERE drugs.id = locked.id
+                    RETURNING drugs.id, drugs.name, drugs.usage_count
+                    """,
+                    keys, [counts[key] for key in keys]
+                )
+                drugs = [dict(row) for row in rows]
+                if drugs:
+                    await notify_change(conn, 'drugs', drugs=drugs)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении справочника препаратов: {e}", exc_info=True)
+        return []
+    index_drugs(drugs)
+    return drugs
+
+
+@timed_db_call
+async def add_drug(name: str, pool: asyncpg.Pool) -> Optional[Dict]:
+    # None — препарат с таким названием (без учёта регистра) уже есть
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                "INSERT INTO drugs (name) VALUES ($1) ON CONFLICT ((lower(name))) DO NOTHING RETURNING id, name, usage_count",
+                name
+            )
+            if row is None:
+                return None
+            drug = dict(row)
+            await notify_change(conn, 'drugs', drugs=[drug])
+    index_drugs([drug])
+    return drug
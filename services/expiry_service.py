@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import List
+import asyncpg
+from config import EXPIRY_SWEEP_INTERVAL, EXPIRY_BATCH_SIZE
+from db.database import notify_ids_change
+from services.recipe_service import invalidate_recipe_cache
+from utils.metrics import timed_db_call
+
+logger = logging.getLogger(__name__)
+
+# SKIP LOCKED: рецепты, которые сейчас списывает фармацевт, достанутся следующему проходу
+EXPIRE_BATCH_SQL = """
+    WITH batch AS (
+        SELECT id FROM recipes
+        WHERE status = 'active' AND expires_at <= LOCALTIMESTAMP
+        ORDER BY expires_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE recipes r SET status = 'expired'
+    FROM batch
+    WHERE r.id = batch.id
+    RETURNING r.id
+"""
+
+
+@timed_db_call
+async def expire_recipes_batch(pool: asyncpg.Pool, batch_size: int = EXPIRY_BATCH_SIZE) -> List[int]:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            recipe_ids = [row['id'] for row in await conn.fetch(EXPIRE_BATCH_SQL, batch_size)]
+            await notify_ids_change(conn, 'recipes', 'recipe_ids', recipe_ids)
+    for recipe_id in recipe_ids:
+        invalidate_recipe_cache(recipe_id)
+    return recipe_ids
+
+
+async def expire_recipes(pool: asyncpg.Pool, batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    # Короткая транзакция на каждую пачку, чтобы не держать блокировки на всю таблицу
+    total = 0
+    while True:
+        expired = await expire_recipes_batch(pool, batch_size)
+        total += len(expired)
+        if len(expired) < batch_size:
+            return total
+
+
+async def run_expiry_sweeper(pool: asyncpg.Pool, interval: float = EXPIRY_SWEEP_INTERVAL) -> None:
+    while True:
+        try:
+            expired = await expire_recipes(pool)
+            if expired:
+                logger.info(f"Помечено просроченных рецептов: {expired}")
+        except Exception as e:
+            logger.error(f"Ошибка при пометке просроченных рецептов: {e}", exc_info=True)
+        await asyncio.sleep(interval)
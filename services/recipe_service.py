@@ -1,71 +1,374 @@
 import asyncpg
 import json
-from typing import Optional, List, Dict
+import re
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Any
+from config import RECIPE_CACHE_TTL, RECIPE_CACHE_SIZE, EXTERNAL_ID_FILTER_MIN_CAPACITY, EXTERNAL_ID_FILTER_ERROR_RATE
+from db.database import db, notify_change, notify_ids_change
+from services.drug_service import record_drug_usage
+from utils.bloom_filter import BloomFilter
+from utils.metrics import timed_db_call
+from utils.ttl_cache import TTLCache, MISSING
 
+# recipes.id — integer: большие числа не пройдут ни в подготовленный запрос, ни в ANY($1::int[])
+MAX_RECIPE_ID = 2_147_483_647
+# Внутренний ID без ведущих нулей: «0001234» — скорее опечатка в номере бланка, чем рецепт #1234
+INTERNAL_ID_PATTERN = re.compile(r'[1-9][0-9]{0,9}')
 
+# Ключи: ('recipe', id) — get_recipe_by_id, ('full', id) — get_recipe_full
+_recipe_cache = TTLCache(maxsize=RECIPE_CACHE_SIZE, ttl=RECIPE_CACHE_TTL)
+
+# Известные external_id; до окончания прогрева is_duplicate всегда идёт в базу
+_external_ids = BloomFilter(EXTERNAL_ID_FILTER_MIN_CAPACITY, EXTERNAL_ID_FILTER_ERROR_RATE)
+_external_ids_ready = False
+
+
+def invalidate_recipe_cache(recipe_id: Optional[int] = None) -> None:
+    if recipe_id is None:
+        _recipe_cache.clear()
+    else:
+        _recipe_cache.pop(('recipe', recipe_id))
+        _recipe_cache.pop(('full', recipe_id))
+
+
+def _on_recipes_changed(event: Optional[Dict]) -> None:
+    if event and event.get('external_id'):
+        _external_ids.add(event['external_id'])
+    if event and 'recipe_ids' in event:
+        for recipe_id in event['recipe_ids']:
+            invalidate_recipe_cache(recipe_id)
+    else:
+        invalidate_recipe_cache(event.get('recipe_id') if event else None)
+
+
+db.subscribe('recipes', _on_recipes_changed)
+db.subscribe('recipe_items', _on_recipes_changed)
+
+
+def get_recipe_cache_stats() -> Dict[str, Any]:
+    return _recipe_cache.stats()
+
+
+def get_external_id_filter_stats() -> Dict[str, Any]:
+    return {'ready': _external_ids_ready, **_external_ids.stats()}
+
+
+async def warm_up_external_ids(pool: asyncpg.Pool) -> int:
+    # Пропущенное уведомление даст ложное «нет» в is_duplicate, но дубликат всё равно
+    # не пройдёт: create_recipe вставляет через ON CONFLICT (external_id) DO NOTHING
+    global _external_ids, _external_ids_ready
+    async with pool.acquire() as conn:
+        total = await conn.fetchval("SELECT count(*) FROM recipes WHERE external_id IS NOT NULL")
+        # Уведомления во время прогрева попадают в новый фильтр
+        _external_ids_ready = False
+        _external_ids = BloomFilter(max(EXTERNAL_ID_FILTER_MIN_CAPACITY, total * 2), EXTERNAL_ID_FILTER_ERROR_RATE)
+        async with conn.transaction():
+            async for row in conn.cursor("SELECT external_id FROM recipes WHERE external_id IS NOT NULL", prefetch=10000):
+                _external_ids.add(row['external_id'])
+    _external_ids_ready = True
+    return _external_ids.count
+
+
+@timed_db_call
 async def is_duplicate(recipe_id: str, pool: asyncpg.Pool) -> bool:
-    try:
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT id FROM recipes WHERE external_id = $1", recipe_id)
-            return row is not None
-    except Exception:
+    checked = _external_ids_ready
+    if checked and recipe_id not in _external_ids:
         return False
+    async with pool.acquire() as conn:
+        found = await (await conn.prepared('recipe_id_by_external_id')).fetchval(recipe_id) is not None
+    if checked and not found:
+        _external_ids.record_false_positive()
+    return found
 
 
+@timed_db_call
+async def find_recipe_id(query: str, pool: asyncpg.Pool) -> Optional[int]:
+    # Сначала номер бланка (external_id, уникальный индекс), затем внутренний числовой ID
+    async with pool.acquire() as conn:
+        recipe_id = await (await conn.prepared('recipe_id_by_external_id')).fetchval(query)
+    if recipe_id is None and INTERNAL_ID_PATTERN.fullmatch(query) and int(query) <= MAX_RECIPE_ID:
+        recipe_id = int(query)
+    return recipe_id
+
+
+def parse_quantity(quantity) -> int:
+    if quantity is None or quantity == '':
+        return 0
+    if isinstance(quantity, (int, float)):
+        return int(quantity)
+    if isinstance(quantity, str):
+        numbers = re.findall(r'\d+', quantity)
+        return int(numbers[0]) if numbers else 0
+    return 0
+
+
+@timed_db_call
+async def create_recipe(external_id: str, doctor_id: int, duration_days: int, comment: Optional[str], items: List[Dict], pool: asyncpg.Pool) -> Optional[int]:
+    records = [(str(item['drug_name']), parse_quantity(item.get('quantity'))) for item in items if item.get('drug_name')]
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Уникальный индекс по external_id заменяет отдельную проверку is_duplicate
+            recipe_id = await conn.fetchval(
+                "INSERT INTO recipes (doctor_id, duration_days, comment, status, external_id) VALUES ($1, $2, $3, 'active', $4) ON CONFLICT (external_id) DO NOTHING RETURNING id",
+                doctor_id, duration_days, comment or None, external_id
+            )
+            if recipe_id is None:
+                return None
+            if records:
+                await conn.copy_records_to_table(
+                    'recipe_items',
+                    records=[(recipe_id, drug_name, quantity) for drug_name, quantity in records],
+                    columns=['recipe_id', 'drug_name', 'quantity']
+                )
+            await notify_change(conn, 'recipes', recipe_id=recipe_id, external_id=external_id)
+    _external_ids.add(external_id)
+    await record_drug_usage([drug_name for drug_name, _ in records], pool)
+    return recipe_id
+
+
+@timed_db_call
 async def get_recipe_by_id(recipe_id: int, pool: asyncpg.Pool) -> Optional[Dict]:
+    cached = _recipe_cache.get(('recipe', recipe_id))
+    if cached is not MISSING:
+        return cached
+
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT r.id, r.doctor_id, r.created_at, r.duration_days, r.comment, r.status, u.username as doctor_username, u.full_name as doctor_name FROM recipes r JOIN users u ON r.doctor_id = u.id WHERE r.id = $1",
-            recipe_id
-        )
+        row = await (await conn.prepared('recipe_by_id')).fetchrow(recipe_id)
         if not row:
             return None
         
-        items = await conn.fetch("SELECT id, drug_name, quantity FROM recipe_items WHERE recipe_id = $1", recipe_id)
-        return {
+        items = await (await conn.prepared('items_by_recipe')).fetch(recipe_id)
+        recipe = {
             'id': row['id'],
             'doctor_id': row['doctor_id'],
             'created_at': row['created_at'],
             'duration_days': row['duration_days'],
+            'expires_at': row['expires_at'],
             'comment': row['comment'],
             'status': row['status'],
+            'external_id': row['external_id'],
             'doctor_username': row['doctor_username'],
             'doctor_name': row['doctor_name'],
             'items': [{'id': item['id'], 'drug_name': item['drug_name'], 'quantity': item['quantity']} for item in items]
         }
+    _recipe_cache.set(('recipe', recipe_id), recipe)
+    return recipe
 
 
-async def get_recipes_by_doctor(doctor_id: int, pool: asyncpg.Pool, limit: int = 50) -> List[Dict]:
+@timed_db_call
+async def get_recipe_full(recipe_id: int, pool: asyncpg.Pool) -> Optional[Dict]:
+    cached = _recipe_cache.get(('full', recipe_id))
+    if cached is not MISSING:
+        return cached
+
+    async with pool.acquire() as conn:
+        row = await (await conn.prepared('recipe_full')).fetchrow(recipe_id)
+    if not row:
+        return None
+
+    logs = json.loads(row['logs'])
+    for log in logs:
+        log['created_at'] = datetime.fromisoformat(log['created_at'])
+    recipe = {
+        'id': row['id'],
+        'doctor_id': row['doctor_id'],
+        'created_at': row['created_at'],
+        'duration_days': row['duration_days'],
+        'expires_at': row['expires_at'],
+        'comment': row['comment'],
+        'status': row['status'],
+        'external_id': row['external_id'],
+        'doctor_username': row['doctor_username'],
+        'doctor_name': row['doctor_name'],
+        'items': json.loads(row['items']),
+        'logs': logs
+    }
+    _recipe_cache.set(('full', recipe_id), recipe)
+    return recipe
+
+
+@timed_db_call
+async def count_recipes_by_doctor(doctor_id: int, pool: asyncpg.Pool) -> int:
+    async with pool.acquire() as conn:
+        return await conn.fetchval("SELECT count(*) FROM recipes WHERE doctor_id = $1", doctor_id)
+
+
+@timed_db_call
+async def get_recipes_page_by_doctor(
+    doctor_id: int,
+    pool: asyncpg.Pool,
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    before: Optional[Tuple[datetime, int]] = None
+) -> List[Dict]:
+    # Keyset-пагинация по (created_at, id): after — следующая (более старая) страница, before — предыдущая
+    columns = "r.id, r.created_at, r.duration_days, r.expires_at, r.comment, r.status, (SELECT count(*) FROM recipe_items ri WHERE ri.recipe_id = r.id) AS items_count"
+    async with pool.acquire() as conn:
+        if before:
+            rows = await conn.fetch(
+                f"SELECT {columns} FROM recipes r WHERE r.doctor_id = $1 AND (r.created_at, r.id) > ($2, $3) ORDER BY r.created_at, r.id LIMIT $4",
+                doctor_id, before[0], before[1], limit
+            )
+            rows = list(reversed(rows))
+        elif after:
+            rows = await conn.fetch(
+                f"SELECT {columns} FROM recipes r WHERE r.doctor_id = $1 AND (r.created_at, r.id) < ($2, $3) ORDER BY r.created_at DESC, r.id DESC LIMIT $4",
+                doctor_id, after[0], after[1], limit
+            )
+        else:
+            rows = await conn.fetch(
+                f"SELECT {columns} FROM recipes r WHERE r.doctor_id = $1 ORDER BY r.created_at DESC, r.id DESC LIMIT $2",
+                doctor_id, limit
+            )
+        return [{
+            'id': row['id'],
+            'doctor_id': doctor_id,
+            'created_at': row['created_at'],
+            'duration_days': row['duration_days'],
+            'expires_at': row['expires_at'],
+            'comment': row['comment'],
+            'status': row['status'],
+            'items_count': row['items_count']
+        } for row in rows]
+
+
+def _like_pattern(value: str) -> str:
+    escaped = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+@timed_db_call
+async def search_recipes(
+    filters: Dict[str, Any],
+    pool: asyncpg.Pool,
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    before: Optional[Tuple[datetime, int]] = None
+) -> List[Dict]:
+    # Фильтры: drug, doctor, comment — подстрока (триграммные индексы), date_from/date_to — [с, по)
+    conditions: List[str] = []
+    args: List[Any] = []
+
+    def arg(value: Any) -> str:
+        args.append(value)
+        return f"${len(args)}"
+
+    if filters.get('drug'):
+        conditions.append(f"EXISTS (SELECT 1 FROM recipe_items ri WHERE ri.recipe_id = r.id AND lower(ri.drug_name) LIKE {arg(_like_pattern(filters['drug']))})")
+    if filters.get('doctor'):
+        doctor = filters['doctor'].lstrip('@')
+        conditions.append(f"r.doctor_id IN (SELECT id FROM users WHERE lower(username) = {arg(doctor.lower())} OR lower(full_name) LIKE {arg(_like_pattern(doctor))})")
+    if filters.get('comment'):
+        conditions.append(f"lower(r.comment) LIKE {arg(_like_pattern(filters['comment']))}")
+    if filters.get('date_from'):
+        conditions.append(f"r.created_at >= {arg(filters['date_from'])}")
+    if filters.get('date_to'):
+        conditions.append(f"r.created_at < {arg(filters['date_to'])}")
+
+    # Keyset-пагинация по (created_at, id), как в get_recipes_page_by_doctor
+    order = "DESC"
+    if before:
+        conditions.append(f"(r.created_at, r.id) > ({arg(before[0])}, {arg(before[1])})")
+        order = "ASC"
+    elif after:
+        conditions.append(f"(r.created_at, r.id) < ({arg(after[0])}, {arg(after[1])})")
+
+    where = " AND ".join(conditions) or "TRUE"
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT r.id, r.doctor_id, r.created_at, r.duration_days, r.comment, r.status FROM recipes r WHERE r.doctor_id = $1 ORDER BY r.created_at DESC LIMIT $2",
-            doctor_id, limit
+            f"""
+            SELECT r.id, r.created_at, r.duration_days, r.expires_at, r.status, r.external_id,
+                   u.username AS doctor_username, u.full_name AS doctor_name,
+                   (SELECT count(*) FROM recipe_items ri WHERE ri.recipe_id = r.id) AS items_count
+            FROM recipes r JOIN users u ON r.doctor_id = u.id
+            WHERE {where}
+            ORDER BY r.created_at {order}, r.id {order}
+            LIMIT {arg(limit)}
+            """,
+            *args
         )
-        recipes = []
-        for row in rows:
-            items = await conn.fetch("SELECT id, drug_name, quantity FROM recipe_items WHERE recipe_id = $1", row['id'])
-            recipes.append({
-                'id': row['id'],
-                'doctor_id': row['doctor_id'],
-                'created_at': row['created_at'],
-                'duration_days': row['duration_days'],
-                'comment': row['comment'],
-                'status': row['status'],
-                'items': [{'id': item['id'], 'drug_name': item['drug_name'], 'quantity': item['quantity']} for item in items]
-            })
-        return recipes
-
-
-async def mark_recipe_as_used(recipe_id: int, pharmacist_id: int, pool: asyncpg.Pool) -> None:
+    if before:
+        rows = list(reversed(rows))
+    return [{
+        'id': row['id'],
+        'created_at': row['created_at'],
+        'duration_days': row['duration_days'],
+        'expires_at': row['expires_at'],
+        'status': row['status'],
+        'external_id': row['external_id'],
+        'doctor_username': row['doctor_username'],
+        'doctor_name': row['doctor_name'],
+        'items_count': row['items_count']
+    } for row in rows]
+
+
+@timed_db_call
+async def mark_recipe_as_used(recipe_id: int, pharmacist_id: int, pool: asyncpg.Pool) -> bool:
+    # Условие на статус делает списание атомарным: из параллельных вызовов строку обновит только один,
+    # остальные дождутся его COMMIT и получат пустой RETURNING
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute("UPDATE recipes SET status = 'used' WHERE id = $1", recipe_id)
+            updated = await conn.fetchval(
+                "UPDATE recipes SET status = 'used' WHERE id = $1 AND status = 'active' AND expires_at > LOCALTIMESTAMP RETURNING id",
+                recipe_id
+            )
+            if updated is None:
+                return False
             await conn.execute(
                 "INSERT INTO recipe_logs (recipe_id, pharmacist_id, action_type, changes) VALUES ($1, $2, 'used', '{}'::jsonb)",
                 recipe_id, pharmacist_id
             )
+            await notify_change(conn, 'recipes', recipe_id=recipe_id)
+    invalidate_recipe_cache(recipe_id)
+    return True
 
 
+@timed_db_call
+async def get_recipes_for_dispense(recipe_ids: List[int], pool: asyncpg.Pool) -> Dict[int, Dict]:
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT r.id,
+                   -- Просроченный, но ещё не обработанный фоновой задачей рецепт уже нельзя списать
+                   CASE WHEN r.status = 'active' AND r.expires_at <= LOCALTIMESTAMP THEN 'expired' ELSE r.status END AS status,
+                   COALESCE((
+                SELECT json_agg(json_build_object('drug_name', ri.drug_name, 'quantity', ri.quantity) ORDER BY ri.id)
+                FROM recipe_items ri WHERE ri.recipe_id = r.id
+            ), '[]'::json) AS items
+            FROM recipes r
+            WHERE r.id = ANY($1::int[])
+            """,
+            recipe_ids
+        )
+    return {row['id']: {
+        'id': row['id'],
+        'status': row['status'],
+        'items': json.loads(row['items'])
+    } for row in rows}
+
+
+@timed_db_call
+async def mark_recipes_as_used_batch(recipe_ids: List[int], pharmacist_id: int, pool: asyncpg.Pool) -> List[int]:
+    # Списываются только всё ещё активные и не просроченные рецепты; возвращаются id тех, что реально списаны
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            used_ids = [row['id'] for row in await conn.fetch(
+                "UPDATE recipes SET status = 'used' WHERE id = ANY($1::int[]) AND status = 'active' AND expires_at > LOCALTIMESTAMP RETURNING id",
+                recipe_ids
+            )]
+            if used_ids:
+                await conn.copy_records_to_table(
+                    'recipe_logs',
+                    records=[(recipe_id, pharmacist_id, 'used', '{}') for recipe_id in used_ids],
+                    columns=['recipe_id', 'pharmacist_id', 'action_type', 'changes']
+                )
+                await notify_ids_change(conn, 'recipes', 'recipe_ids', used_ids)
+    for recipe_id in used_ids:
+        invalidate_recipe_cache(recipe_id)
+    return used_ids
+
+
+@timed_db_call
 async def update_recipe_item_quantity(item_id: int, new_quantity: str | int, pharmacist_id: int, recipe_id: int, pool: asyncpg.Pool) -> None:
     async with pool.acquire() as conn:
         async with conn.transaction():
@@ -78,14 +381,14 @@ async def update_recipe_item_quantity(item_id: int, new_quantity: str | int, pha
                 "INSERT INTO recipe_logs (recipe_id, pharmacist_id, action_type, changes) VALUES ($1, $2, 'edited_quantity', $3::jsonb)",
                 recipe_id, pharmacist_id, json.dumps(changes)
             )
+            await notify_change(conn, 'recipe_items', recipe_id=recipe_id, item_id=item_id)
+    invalidate_recipe_cache(recipe_id)
 
 
+@timed_db_call
 async def get_recipe_logs(recipe_id: int, pool: asyncpg.Pool) -> List[Dict]:
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT rl.id, rl.action_type, rl.changes, rl.created_at, u.username as pharmacist_username, u.full_name as pharmacist_name FROM recipe_logs rl JOIN users u ON rl.pharmacist_id = u.id WHERE rl.recipe_id = $1 ORDER BY rl.created_at DESC",
-            recipe_id
-        )
+        rows = await (await conn.prepared('logs_by_recipe')).fetch(recipe_id)
         return [{
             'id': row['id'],
             'action_type': row['action_type'],
@@ -1,11 +1,56 @@
 import asyncpg
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
+from config import USER_CACHE_TTL, USER_CACHE_SIZE, UNKNOWN_USER_CACHE_TTL, UNKNOWN_USER_CACHE_SIZE, ADMIN_CACHE_TTL
+from db.database import db, notify_change
+from utils.metrics import timed_db_call
+from utils.ttl_cache import TTLCache, MISSING
 
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_unknown_user_cache = TTLCache(maxsize=UNKNOWN_USER_CACHE_SIZE, ttl=UNKNOWN_USER_CACHE_TTL)
+_admins_cache = TTLCache(maxsize=1, ttl=ADMIN_CACHE_TTL)
 
+
+def invalidate_user_cache(telegram_id: Optional[int] = None) -> None:
+    if telegram_id is None:
+        _user_cache.clear()
+        _unknown_user_cache.clear()
+    else:
+        _user_cache.pop(telegram_id)
+        _unknown_user_cache.pop(telegram_id)
+
+
+def invalidate_admins_cache() -> None:
+    _admins_cache.clear()
+
+
+def _on_users_changed(event: Optional[Dict]) -> None:
+    invalidate_user_cache(event.get('telegram_id') if event else None)
+    if not event or event.get('role') == 'admin':
+        invalidate_admins_cache()
+
+
+db.subscribe('users', _on_users_changed)
+
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    return {
+        'users': _user_cache.stats(),
+        'unknown_users': _unknown_user_cache.stats(),
+        'admins': _admins_cache.stats()
+    }
+
+
+@timed_db_call
 async def get_user_by_telegram_id(telegram_id: int, pool: asyncpg.Pool) -> Optional[Dict]:
+    cached = _user_cache.get(telegram_id)
+    if cached is not MISSING:
+        return cached
+    if _unknown_user_cache.get(telegram_id) is not MISSING:
+        return None
+
     async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT id, telegram_id, username, full_name, role FROM users WHERE telegram_id = $1", telegram_id)
-        return {
+        row = await (await conn.prepared('user_by_telegram_id')).fetchrow(telegram_id)
+        user = {
             'id': row['id'],
             'telegram_id': row['telegram_id'],
             'username': row['username'],
@@ -13,18 +58,49 @@ async def get_user_by_telegram_id(telegram_id: int, pool: asyncpg.Pool) -> Optio
             'role': row['role']
         } if row else None
 
+    if user:
+        _user_cache.set(telegram_id, user)
+    else:
+        _unknown_user_cache.set(telegram_id, None)
+    return user
 
+
+@timed_db_call
 async def add_user(telegram_id: int, username: Optional[str], full_name: Optional[str], role: str, pool: asyncpg.Pool) -> None:
     async with pool.acquire() as conn:
         await conn.execute("INSERT INTO users (telegram_id, username, full_name, role) VALUES ($1, $2, $3, $4)", telegram_id, username, full_name, role)
+        await notify_change(conn, 'users', telegram_id=telegram_id, role=role)
+    invalidate_user_cache(telegram_id)
+    if role == 'admin':
+        invalidate_admins_cache()
 
 
+@timed_db_call
 async def delete_user(user_id: int, pool: asyncpg.Pool) -> bool:
     async with pool.acquire() as conn:
-        result = await conn.execute("DELETE FROM users WHERE id = $1", user_id)
-        return result == "DELETE 1"
+        row = await conn.fetchrow("DELETE FROM users WHERE id = $1 RETURNING telegram_id, role", user_id)
+        if row:
+            await notify_change(conn, 'users', telegram_id=row['telegram_id'], role=row['role'])
+    if not row:
+        return False
+    invalidate_user_cache(row['telegram_id'])
+    if row['role'] == 'admin':
+        invalidate_admins_cache()
+    return True
+
+
+@timed_db_call
+async def get_admins(pool: asyncpg.Pool) -> List[Dict]:
+    cached = _admins_cache.get('admin')
+    if cached is not MISSING:
+        return cached
+
+    admins = await get_users_by_role('admin', pool)
+    _admins_cache.set('admin', admins)
+    return admins
 
 
+@timed_db_call
 async def get_users_by_role(role: str, pool: asyncpg.Pool) -> List[Dict]:
     async with pool.acquire() as conn:
         rows = await conn.fetch("SELECT id, telegram_id, username, full_name, role FROM users WHERE role = $1 ORDER BY id", role)
@@ -37,6 +113,7 @@ async def get_users_by_role(role: str, pool: asyncpg.Pool) -> List[Dict]:
         } for row in rows]
 
 
+@timed_db_call
 async def get_user_by_id(user_id: int, pool: asyncpg.Pool) -> Optional[Dict]:
     async with pool.acquire() as conn:
         row = await conn.fetchrow("SELECT id, telegram_id, username, full_name, role FROM users WHERE id = $1", user_id)
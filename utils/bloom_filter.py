@@ -0,0 +1,58 @@
+import hashlib
+import math
+from typing import Any, Dict, Iterator
+
+
+# Фильтр Блума: «нет» — точно нет, «да» — возможно да (с вероятностью ошибки error_rate)
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        self.checks += 1
+        for position in self._positions(item):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                self.negatives += 1
+                return False
+        return True
+
+    def record_false_positive(self) -> None:
+        self.false_positives += 1
+
+    def stats(self) -> Dict[str, Any]:
+        fill_ratio = int.from_bytes(self._bits, 'little').bit_count() / self.size
+        true_negatives = self.negatives + self.false_positives
+        return {
+            'count': self.count,
+            'capacity': self.capacity,
+            'bits': self.size,
+            'bytes': len(self._bits),
+            'hash_count': self.hash_count,
+            'fill_ratio': round(fill_ratio, 4),
+            'estimated_fp_rate': round(fill_ratio ** self.hash_count, 6),
+            'checks': self.checks,
+            'negatives': self.negatives,
+            'false_positives': self.false_positives,
+            'observed_fp_rate': round(self.false_positives / true_negatives, 6) if true_negatives else 0.0
+        }
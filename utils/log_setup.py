@@ -0,0 +1,67 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from config import LOG_LEVEL, LOG_DIR, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+# Поля, которые LoggingMiddleware передаёт через extra
+EXTRA_FIELDS = ('user_id', 'username', 'update_type', 'handler', 'duration_ms', 'text', 'error')
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    # Очередь внутри процесса: запись не нужно форматировать заранее, это сделает поток слушателя
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    # Обработчики с вводом-выводом работают в потоке QueueListener, event loop только кладёт записи в очередь
+    handlers = []
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handlers.append(console_handler)
+
+    file_error = None
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(LOG_DIR, 'bot.jsonl'), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        file_error = e
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_InProcessQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    if file_error:
+        logging.getLogger(__name__).warning(f"Запись логов в {LOG_DIR} недоступна: {file_error}")
+    return listener
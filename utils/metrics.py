@@ -0,0 +1,164 @@
+import contextvars
+import functools
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: [счётчики по корзинам..., сумма, количество]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self._values.items():
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATES_RECEIVED = REGISTRY.register(Counter("bot_updates_received_total", "Updates received by the dispatcher", ["update_type"]))
+UPDATES_HANDLED = REGISTRY.register(Counter("bot_updates_handled_total", "Updates that reached a handler", ["update_type", "router"]))
+HANDLER_LATENCY = REGISTRY.register(Histogram("bot_handler_duration_seconds", "Handler latency including inner middlewares", ["router", "handler"]))
+DB_CALL_LATENCY = REGISTRY.register(Histogram("db_call_duration_seconds", "Latency of service functions that query the database", ["function"]))
+DB_CALL_ERRORS = REGISTRY.register(Counter("db_call_errors_total", "Service function calls that raised", ["function"]))
+DB_CALL_CACHED = REGISTRY.register(Counter("db_call_cached_total", "Service function calls served without touching the pool", ["function"]))
+DB_CALL_ACQUIRES = REGISTRY.register(Counter("db_call_acquires_total", "Pool connections acquired by service functions", ["function"]))
+DB_POOL_WAIT = REGISTRY.register(Histogram("db_pool_wait_seconds", "Time spent waiting for a pool connection", buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge("db_pool_connections", "Pool connections by state", ["state"]))
+TELEGRAM_API_LATENCY = REGISTRY.register(Histogram("telegram_api_duration_seconds", "Telegram Bot API call latency", ["method"]))
+TELEGRAM_API_ERRORS = REGISTRY.register(Counter("telegram_api_errors_total", "Failed Telegram Bot API calls", ["method", "error"]))
+
+
+# Счётчик соединений, взятых из пула внутри текущего вызова сервисной функции
+_call_acquires: contextvars.ContextVar = contextvars.ContextVar('db_call_acquires', default=None)
+
+
+def record_pool_acquire(wait: float) -> None:
+    DB_POOL_WAIT.observe(wait)
+    counter = _call_acquires.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def timed_db_call(func: Callable) -> Callable:
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        # Вложенный вызов считается в пользу внешнего: иначе его соединения попадут в метрики дважды
+        if _call_acquires.get() is not None:
+            return await func(*args, **kwargs)
+        counter = [0]
+        token = _call_acquires.set(counter)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            DB_CALL_ERRORS.inc(function=name)
+            raise
+        finally:
+            _call_acquires.reset(token)
+            if counter[0]:
+                DB_CALL_LATENCY.observe(time.perf_counter() - started, function=name)
+                DB_CALL_ACQUIRES.inc(counter[0], function=name)
+            else:
+                DB_CALL_CACHED.inc(function=name)
+    return wrapper
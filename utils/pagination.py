@@ -0,0 +1,13 @@
+from datetime import datetime
+
+
+def page_cursor(recipes: list) -> dict:
+    # В FSM храним только границы текущей страницы, а не сами рецепты
+    return {
+        'first': [recipes[0]['created_at'].isoformat(), recipes[0]['id']],
+        'last': [recipes[-1]['created_at'].isoformat(), recipes[-1]['id']]
+    }
+
+
+def parse_cursor_key(key: list) -> tuple:
+    return datetime.fromisoformat(key[0]), key[1]
@@ -0,0 +1,64 @@
+import bisect
+import heapq
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+# Индекс по префиксам слов: отсортированный список (слово, id) и бинарный поиск по нему
+class PrefixIndex:
+    def __init__(self):
+        self._keys: List[Tuple[str, int]] = []
+        # id -> (название, вес, слова названия)
+        self._items: Dict[int, Tuple[str, int, List[str]]] = {}
+
+    def add(self, item_id: int, name: str, weight: int = 0) -> None:
+        current = self._items.get(item_id)
+        if current is not None and current[0] == name:
+            self._items[item_id] = (name, weight, current[2])
+            return
+        if current is not None:
+            self.remove(item_id)
+        tokens = sorted(set(tokenize(name)))
+        for token in tokens:
+            bisect.insort(self._keys, (token, item_id))
+        self._items[item_id] = (name, weight, tokens)
+
+    def remove(self, item_id: int) -> None:
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return
+        for token in item[2]:
+            index = bisect.bisect_left(self._keys, (token, item_id))
+            if index < len(self._keys) and self._keys[index] == (token, item_id):
+                del self._keys[index]
+
+    def get(self, item_id: int) -> Optional[Tuple[str, int, List[str]]]:
+        return self._items.get(item_id)
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, str, int]]:
+        words = tokenize(query)
+        if not words:
+            return []
+
+        # Кандидаты — по самому длинному слову запроса, остальные слова проверяются по названию
+        anchor = max(words, key=len)
+        candidates = set()
+        index = bisect.bisect_left(self._keys, (anchor,))
+        while index < len(self._keys) and self._keys[index][0].startswith(anchor):
+            candidates.add(self._keys[index][1])
+            index += 1
+
+        rest = [word for word in words if word != anchor]
+        matches = []
+        for item_id in candidates:
+            name, weight, tokens = self._items[item_id]
+            if all(any(token.startswith(word) for token in tokens) for word in rest):
+                matches.append((item_id, name, weight))
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match[2], match[1]))
+
+    def __len__(self) -> int:
+        return len(self._items)
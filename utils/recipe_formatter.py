@@ -1,12 +1,26 @@
 from datetime import datetime
+from html import escape
 from typing import Dict, List
 from utils.date_formatter import format_datetime, format_date, format_duration_days, calculate_expires_at
 
 
+RECIPE_STATUSES = {
+    'active': ("📝", "Активен"),
+    'used': ("✅", "Списан"),
+    'expired': ("⌛", "Просрочен"),
+}
+
+
+def effective_status(recipe: Dict) -> str:
+    # Между проходами фоновой задачи активный рецепт уже может быть просрочен
+    expires_at = recipe.get('expires_at')
+    if recipe['status'] == 'active' and expires_at and datetime.now() > expires_at:
+        return 'expired'
+    return recipe['status']
+
+
 def format_recipe_status(recipe: Dict) -> tuple[str, str]:
-    status_emoji = "✅" if recipe['status'] == 'used' else "📝"
-    status_text = "Списан" if recipe['status'] == 'used' else "Активен"
-    return status_emoji, status_text
+    return RECIPE_STATUSES.get(effective_status(recipe), RECIPE_STATUSES['active'])
 
 
 def format_recipe_items(items: List[Dict]) -> str:
@@ -33,8 +47,8 @@ def format_pharmacist_name(log: Dict) -> str:
 def format_recipe_detail(recipe: Dict, recipe_id: int) -> str:
     status_emoji, status_text = format_recipe_status(recipe)
     created_at = recipe['created_at']
-    expires_at = calculate_expires_at(created_at, recipe['duration_days'])
-    is_expired = datetime.now() > expires_at
+    # expires_at считает сама база; расчёт на месте — для словарей без этого поля
+    expires_at = recipe.get('expires_at') or calculate_expires_at(created_at, recipe['duration_days'])
     
     items_text = format_recipe_items(recipe['items'])
     doctor_name = format_doctor_name(recipe)
@@ -42,13 +56,14 @@ def format_recipe_detail(recipe: Dict, recipe_id: int) -> str:
     recipe_text = (
         f"{status_emoji} <b>Рецепт #{recipe_id}</b>\n\n"
         "━━━━━━━━━━━━━━━━━━━━\n"
+        f"🧾 <b>Номер бланка:</b> {escape(recipe.get('external_id') or '—')}\n"
         f"👨‍⚕️ <b>Врач:</b> {doctor_name}\n"
         f"📅 <b>Дата создания:</b> {format_datetime(created_at)}\n"
         f"⏱ <b>Срок действия:</b> {recipe['duration_days']} дней (до {format_date(expires_at)})\n"
         f"📊 <b>Статус:</b> {status_text}\n"
     )
     
-    if is_expired and recipe['status'] == 'active':
+    if effective_status(recipe) == 'expired':
         recipe_text += "⚠️ <b>Рецепт просрочен!</b>\n"
     
     recipe_text += f"\n💊 <b>Препараты:</b>\n{items_text}\n"
@@ -72,3 +87,30 @@ def format_recipe_logs(logs: List[Dict]) -> str:
         logs_text += f"• {action_text} - {pharmacist_name} ({format_datetime(log['created_at'])})\n"
     
     return logs_text
+
+
+def format_batch_dispense_summary(recipe_ids: List[int], recipes: Dict[int, Dict]) -> str:
+    groups = {'active': [], 'used': [], 'expired': [], 'missing': []}
+    totals: Dict[str, int] = {}
+    for recipe_id in recipe_ids:
+        recipe = recipes.get(recipe_id)
+        groups[recipe['status'] if recipe else 'missing'].append(f"#{recipe_id}")
+        if recipe and recipe['status'] == 'active':
+            for item in recipe['items']:
+                totals[item['drug_name']] = totals.get(item['drug_name'], 0) + (item['quantity'] or 0)
+
+    text = "📦 <b>Списание нескольких рецептов</b>\n\n"
+    labels = [
+        ('active', "✅ К списанию"),
+        ('used', "⛔ Уже списаны"),
+        ('expired', "⌛ Просрочены"),
+        ('missing', "❓ Не найдены"),
+    ]
+    for status, label in labels:
+        if groups[status]:
+            text += f"{label} ({len(groups[status])}): {', '.join(groups[status])}\n"
+
+    if totals:
+        items = [{'drug_name': drug_name, 'quantity': quantity} for drug_name, quantity in totals.items()]
+        text += f"\n💊 <b>Итого препаратов:</b>\n{format_recipe_items(items)}"
+    return text
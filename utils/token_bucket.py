@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class KeyedTokenBucket:
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Через burst / rate секунд простоя ведро снова полное — такую запись можно просто удалить
+        self.idle_ttl = burst / rate if rate > 0 else 0
+        # ключ -> (токены, время последнего пополнения), от давно неактивных к активным
+        self._buckets: OrderedDict[Hashable, Tuple[float, float]] = OrderedDict()
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def wait_time(self, key: Hashable, now: Optional[float] = None) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> bool:
+        if self.rate <= 0:
+            return True
+
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+
+        tokens = self._tokens(key, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets.pop(key, None)
+        self._buckets[key] = (tokens, now)
+
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict_idle(self, now: float) -> None:
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_ttl:
+                break
+            del self._buckets[key]